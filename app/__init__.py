@@ -1,42 +1,125 @@
 from flask import Flask
 from flask_jwt_extended import JWTManager
 from flask_cors import CORS
+from dotenv import load_dotenv
 from pymongo import MongoClient
+from pymongo.errors import OperationFailure
+import logging
 import os
+import threading
+import time
 
 # Importa as classes Product e User
-from app.models import Product, User
+# (o pymongo é carregado na importação pelos modelos e rotas; o que fica para o primeiro
+# uso é a criação do MongoClient e a conexão com o servidor)
+from app.models import Product, User, StorageCapacity, IdempotencyKey
 
 # Variável global para a instância do banco de dados MongoDB
-# Esta variável será acessada pelos métodos .collection() das suas classes de modelo
+# Preenchida por get_db() no primeiro acesso; os métodos .collection() das classes de modelo usam get_db()
 db = None
+_db_lock = threading.Lock()
+
+# Modelos cujos índices ainda não foram criados. Os índices únicos de User ficam por último.
+_pending_index_models = [Product, StorageCapacity, IdempotencyKey, User]
+_index_lock = threading.Lock()
+_index_thread = None
+_last_index_attempt = None
+
+# Intervalo mínimo entre tentativas de criar os índices que falharam
+INDEX_RETRY_SECONDS = int(os.environ.get('MONGO_INDEX_RETRY_SECONDS', 60))
+
+
+def ensure_indexes():
+    """
+    Cria os índices pendentes. Cada modelo é tratado separadamente: a falha de um (por
+    exemplo, usuários duplicados antigos impedindo os índices únicos de User) não pode
+    deixar os demais sem índice. Os que falharem continuam pendentes.
+    Retorna os nomes dos modelos ainda pendentes.
+    """
+    global _pending_index_models
+    still_pending = []
+    for model in list(_pending_index_models):
+        try:
+            model.ensure_indexes()
+        except Exception as e:
+            logging.error(f"Erro ao criar índices do MongoDB para {model.__name__}: {e}")
+            still_pending.append(model)
+    _pending_index_models = still_pending
+    _enable_pre_images()
+    return [model.__name__ for model in still_pending]
+
+
+_pre_images_checked = False
+
+
+def _enable_pre_images():
+    # Uma tentativa por processo: em MongoDB < 6.0 (ou sem permissão de collMod)
+    # o feed SSE funciona sem pre-images, com a lista de IDs enviados por conexão
+    global _pre_images_checked
+    if _pre_images_checked:
+        return
+    try:
+        Product.enable_pre_images()
+        _pre_images_checked = True
+    except OperationFailure as e:
+        _pre_images_checked = True
+        logging.warning(f"Pre-images do change stream de produtos indisponíveis: {e}")
+    except Exception as e:
+        # Falha de conexão: tenta de novo junto com os índices pendentes
+        logging.error(f"Erro ao habilitar as pre-images do change stream de produtos: {e}")
+
+
+def _schedule_index_creation():
+    # Em segundo plano: com o MongoDB fora do ar, a requisição não espera os timeouts de cada índice
+    global _index_thread, _last_index_attempt
+    with _index_lock:
+        if _index_thread is not None and _index_thread.is_alive():
+            return
+        if _last_index_attempt is not None and time.monotonic() - _last_index_attempt < INDEX_RETRY_SECONDS:
+            return
+        _last_index_attempt = time.monotonic()
+        _index_thread = threading.Thread(target=ensure_indexes, name='mongo_indexes', daemon=True)
+        _index_thread.start()
+
+
+def get_db():
+    """
+    Retorna o banco MongoDB, criando o MongoClient no primeiro uso (thread-safe).
+    Assim a aplicação sobe sem esperar o MongoDB. Os índices são criados em segundo plano
+    e as criações que falharem são repetidas em acessos posteriores (no máximo a cada
+    INDEX_RETRY_SECONDS); 'flask ensure-indexes' as executa de forma síncrona.
+    """
+    global db
+    if db is None:
+        with _db_lock:
+            if db is None:
+                mongo_client = MongoClient(os.environ.get('MONGO_URI'))
+                db = mongo_client[os.environ.get('MONGO_DB_NAME', 'quimicadocs_db')]
+                logging.info("Conexão MongoDB inicializada.")
+    if _pending_index_models:
+        _schedule_index_creation()
+    return db
+
 
 def create_app():
+    # Carrega o .env antes de ler a configuração (antes era feito na importação de pdf_routes)
+    load_dotenv()
+
     app = Flask(__name__)
 
     # Configurações do Flask com valores padrão para evitar erros
     app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY')
     app.config['MONGO_URI'] = os.environ.get('MONGO_URI')
     app.config['JWT_SECRET_KEY'] = os.environ.get('JWT_SECRET_KEY')
+    # Apenas cabeçalhos: o feed SSE (/products/events) libera ?jwt= só para a própria rota
+    app.config['JWT_TOKEN_LOCATION'] = ['headers']
     app.config['MONGO_DB_NAME'] = os.environ.get('MONGO_DB_NAME', 'quimicadocs_db') # Nome do seu banco de dados MongoDB
 
     # Inicializa JWT
     jwt = JWTManager(app)
 
-    # Conexão com o MongoDB
-    try:
-        mongo_client = MongoClient(app.config['MONGO_URI'])
-        global db # Declara que você vai modificar a variável global 'db'
-        db = mongo_client[app.config['MONGO_DB_NAME']] # Atribui o banco de dados específico
-        print("Conexão MongoDB estabelecida com sucesso.")
-    except Exception as e:
-        print(f"Erro ao conectar ao MongoDB: {e}")
-        exit(1) # Saída segura se a conexão falhar
-
-    # REMOVIDAS: As linhas abaixo não são mais necessárias
-    # User.set_collection(app.mongo_db['users'])
-    # Product.set_collection(app.mongo_db['products'])
-    # O método .collection() nas classes User e Product já importa 'db' e retorna a coleção.
+    # A conexão com o MongoDB não é aberta aqui: get_db() a cria na primeira consulta.
+    # O método .collection() das classes de modelo chama get_db() e retorna a coleção.
 
     # Configuração do CORS para permitir requisições do frontend
     CORS(app, resources={r"/*": {"origins": "http://localhost:3000"}})
@@ -45,10 +128,16 @@ def create_app():
     from app.routes.user_routes import user_bp
     from app.routes.product_routes import product_bp
     from app.routes.pdf_routes import pdf_bp
+    from app.routes.storage_routes import storage_bp
 
     app.register_blueprint(user_bp) 
     app.register_blueprint(product_bp)# (OPCIONAL) Adicionar um prefixo /api, comum para APIs - (pdf_bp, url_prefix='/api')
     app.register_blueprint(pdf_bp)
+    app.register_blueprint(storage_bp)
+
+    # Comandos de manutenção (flask <comando>)
+    from app.commands import register_commands
+    register_commands(app)
 
     # Rota inicial
     @app.route('/')
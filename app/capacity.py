@@ -0,0 +1,254 @@
+# app/capacity.py
+"""
+Capacidade de armazenamento: normalização de 'qtade_maxima_armazenada' e totais por
+local de armazenamento, empresa e classe GHS.
+
+O texto livre da quantidade (ex.: "200 L", "1.500,5 kg", "500 mL") é convertido na
+escrita para 'qtade_normalizada' = {"valor": <float>, "unidade": "kg" | "L"}.
+Os totais ficam na coleção 'storage_capacity', um documento por
+(dimensão, chave, unidade), e são atualizados com $inc a cada escrita de produto.
+Os limites por local vêm de STORAGE_CAPACITY_LIMITS (JSON), por exemplo:
+    {"Almoxarifado A": {"kg": 500, "L": 1000}, "*": {"kg": 2000, "L": 5000}}
+onde "*" vale para os locais sem limite próprio.
+
+Os produtos cadastrados antes deste módulo não têm 'qtade_normalizada': a primeira
+leitura após a implantação recalcula tudo (ensure_capacity), para que os totais e
+os alertas nunca sejam parciais.
+"""
+import json
+import logging
+import os
+import re
+import threading
+
+from pymongo import UpdateOne
+
+from app.models import Product, RebuildState, StorageCapacity
+from app.compatibility import hazard_mask, mask_classes
+
+CAPACITY_DIMENSIONS = ('local_de_armazenamento', 'empresa', 'classe_ghs')
+
+# Unidade informada -> (unidade canônica, fator de conversão)
+UNITS = {
+    'mg': ('kg', 1e-6),
+    'g': ('kg', 1e-3),
+    'gr': ('kg', 1e-3),
+    'grama': ('kg', 1e-3),
+    'gramas': ('kg', 1e-3),
+    'kg': ('kg', 1.0),
+    'kgs': ('kg', 1.0),
+    'quilo': ('kg', 1.0),
+    'quilos': ('kg', 1.0),
+    'quilograma': ('kg', 1.0),
+    'quilogramas': ('kg', 1.0),
+    't': ('kg', 1000.0),
+    'ton': ('kg', 1000.0),
+    'tonelada': ('kg', 1000.0),
+    'toneladas': ('kg', 1000.0),
+    'ml': ('L', 1e-3),
+    'l': ('L', 1.0),
+    'lt': ('L', 1.0),
+    'lts': ('L', 1.0),
+    'litro': ('L', 1.0),
+    'litros': ('L', 1.0),
+    'm3': ('L', 1000.0),
+    'm³': ('L', 1000.0),
+    'gal': ('L', 3.78541),
+    'galao': ('L', 3.78541),
+    'galão': ('L', 3.78541),
+    'galoes': ('L', 3.78541),
+    'galões': ('L', 3.78541),
+}
+
+_QUANTITY_RE = re.compile(r'^\s*(\d[\d.,]*)\s*([a-zA-Zçãõ³0-9]+)\.?\s*$')
+_THOUSANDS_RE = re.compile(r'^\d{1,3}(\.\d{3})+$')
+
+
+def _load_limits():
+    raw = os.environ.get('STORAGE_CAPACITY_LIMITS')
+    if not raw:
+        return {}
+    try:
+        return json.loads(raw)
+    except ValueError:
+        logging.error("STORAGE_CAPACITY_LIMITS não é um JSON válido; alertas de capacidade desativados.")
+        return {}
+
+
+CAPACITY_LIMITS = _load_limits()
+
+REBUILD_NAME = 'storage_capacity'
+_rebuilt = False
+_rebuild_lock = threading.Lock()
+
+
+def _parse_number(text):
+    # Aceita "1.500,5" e "1,5" (padrão brasileiro) e também "1,500.5" e "1.5"
+    if ',' in text and '.' in text:
+        if text.rfind(',') > text.rfind('.'):
+            text = text.replace('.', '').replace(',', '.')
+        else:
+            text = text.replace(',', '')
+    elif ',' in text:
+        text = text.replace(',', '.')
+    elif _THOUSANDS_RE.match(text):
+        text = text.replace('.', '')
+    return float(text)
+
+
+def normalize_quantity(value):
+    """
+    Converte a quantidade informada para {"valor": float, "unidade": "kg" | "L"}.
+    Retorna None se o texto não tem número e unidade reconhecíveis.
+    """
+    if not isinstance(value, str):
+        return None
+    match = _QUANTITY_RE.match(value)
+    if not match:
+        return None
+    unit = UNITS.get(match.group(2).lower())
+    if not unit:
+        return None
+    try:
+        number = _parse_number(match.group(1))
+    except ValueError:
+        return None
+    canonical_unit, factor = unit
+    return {"valor": round(number * factor, 6), "unidade": canonical_unit}
+
+
+def _contributions(doc):
+    """(dimensão, chave, unidade, valor) com que o produto contribui para os totais."""
+    if not doc or doc.get('deleted_at') is not None:
+        return []
+    quantity = doc.get('qtade_normalizada')
+    if not quantity:
+        return []
+    keys = [('local_de_armazenamento', doc.get('local_de_armazenamento')), ('empresa', doc.get('empresa'))]
+    keys.extend(('classe_ghs', name) for name in mask_classes(hazard_mask(doc)))
+    return [
+        (dimension, key, quantity['unidade'], quantity['valor'])
+        for dimension, key in keys
+        if key
+    ]
+
+
+def _counter_id(dimension, key, unit):
+    return f"{dimension}|{key}|{unit}"
+
+
+def apply_capacity(old_doc, new_doc):
+    """
+    Atualiza os totais de capacidade com a diferença entre old_doc e new_doc
+    (None para criação ou exclusão), em um único bulk_write de $inc.
+    """
+    delta = {}
+    for doc, sign in ((old_doc, -1), (new_doc, 1)):
+        for dimension, key, unit, value in _contributions(doc):
+            entry = delta.setdefault((dimension, key, unit), [0.0, 0])
+            entry[0] += sign * value
+            entry[1] += sign
+
+    operations = [
+        UpdateOne(
+            {"_id": _counter_id(dimension, key, unit)},
+            {"$inc": {"total": round(total, 6), "produtos": products},
+             "$setOnInsert": {"dimensao": dimension, "chave": key, "unidade": unit}},
+            upsert=True
+        )
+        for (dimension, key, unit), (total, products) in delta.items()
+        if total or products
+    ]
+    if not operations:
+        return
+    try:
+        StorageCapacity.collection().bulk_write(operations, ordered=False)
+    except Exception:
+        logging.exception("Erro ao atualizar os totais de capacidade de armazenamento.")
+
+
+def location_limits(location):
+    return CAPACITY_LIMITS.get(location) or CAPACITY_LIMITS.get('*') or {}
+
+
+def capacity_alerts(rows):
+    """Alertas para os totais por local que passam do limite configurado."""
+    alerts = []
+    for row in rows:
+        if row['dimensao'] != 'local_de_armazenamento':
+            continue
+        limit = location_limits(row['chave']).get(row['unidade'])
+        if limit is not None and row['total'] > limit:
+            alerts.append({
+                "local_de_armazenamento": row['chave'],
+                "unidade": row['unidade'],
+                "total": row['total'],
+                "limite": limit
+            })
+    return alerts
+
+
+def read_capacity(dimension, key=None):
+    """Totais de uma dimensão (opcionalmente de uma chave), pela coleção de totais indexada."""
+    ensure_capacity()
+    match = {"dimensao": dimension, "produtos": {"$gt": 0}}
+    if key:
+        match["chave"] = key
+    return list(StorageCapacity.collection().aggregate([
+        {"$match": match},
+        {"$sort": {"chave": 1, "unidade": 1}},
+        {"$project": {"_id": 0, "dimensao": 1, "chave": 1, "unidade": 1, "total": 1, "produtos": 1}}
+    ]))
+
+
+def location_capacity_alerts(doc):
+    """Alertas do local de armazenamento do produto, após a escrita."""
+    if not doc or not doc.get('local_de_armazenamento'):
+        return []
+    try:
+        return capacity_alerts(read_capacity('local_de_armazenamento', doc['local_de_armazenamento']))
+    except Exception:
+        logging.exception("Erro ao verificar a capacidade de armazenamento.")
+        return []
+
+
+def rebuild_capacity():
+    """Recalcula todos os totais a partir dos produtos (também normaliza as quantidades)."""
+    totals = {}
+    cursor = Product.collection().find(
+        Product.active(),
+        {"qtade_maxima_armazenada": 1, "qtade_normalizada": 1, "local_de_armazenamento": 1,
+         "empresa": 1, "perigos_fisicos": 1, "perigos_saude": 1, "perigos_meio_ambiente": 1}
+    )
+    for doc in cursor:
+        quantity = normalize_quantity(doc.get('qtade_maxima_armazenada'))
+        if quantity != doc.get('qtade_normalizada'):
+            Product.collection().update_one({"_id": doc["_id"]}, {"$set": {"qtade_normalizada": quantity}})
+            doc['qtade_normalizada'] = quantity
+        for dimension, key, unit, value in _contributions(doc):
+            entry = totals.setdefault((dimension, key, unit), [0.0, 0])
+            entry[0] += value
+            entry[1] += 1
+
+    StorageCapacity.collection().delete_many({})
+    documents = [
+        {"_id": _counter_id(dimension, key, unit), "dimensao": dimension, "chave": key,
+         "unidade": unit, "total": round(total, 6), "produtos": products}
+        for (dimension, key, unit), (total, products) in totals.items()
+    ]
+    if documents:
+        StorageCapacity.collection().insert_many(documents)
+    RebuildState.mark_done(REBUILD_NAME)
+    return len(documents)
+
+
+def ensure_capacity():
+    """Normaliza e recalcula os totais se isso nunca foi feito (primeira leitura após a implantação)."""
+    global _rebuilt
+    if _rebuilt:
+        return
+    with _rebuild_lock:
+        if not _rebuilt and not RebuildState.is_done(REBUILD_NAME):
+            total = rebuild_capacity()
+            logging.info(f"Capacidade de armazenamento calculada no primeiro acesso: {total} totais.")
+        _rebuilt = True
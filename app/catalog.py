@@ -0,0 +1,130 @@
+# app/catalog.py
+"""
+Catálogo publicado (produtos aprovados com PDF) usado por GET /pdfs para o papel VIEWER.
+
+Cada documento já está no formato da resposta (_id como string, 'url_download'),
+então a leitura não faz nenhuma transformação por linha. As rotas de produto chamam
+sync_published_catalog() após cada escrita; rebuild_published_catalog() recria a
+coleção inteira a partir dos produtos.
+
+A coleção só passa a existir pelo $out do rebuild: enquanto ela não existe (logo após a
+implantação), sync_published_catalog() não escreve nada e a primeira leitura a constrói.
+"""
+import logging
+import threading
+
+from pymongo.errors import CollectionInvalid
+
+from app.models import Product, PublishedCatalog
+from app.utils import ROLES
+
+
+def is_published(doc):
+    """Mesmo critério da consulta de GET /pdfs para o VIEWER."""
+    return (
+        bool(doc)
+        and doc.get("deleted_at") is None
+        and doc.get("status") == "aprovado"
+        and doc.get("pdf_url") is not None
+    )
+
+
+def catalog_entry(doc):
+    return {
+        "_id": str(doc["_id"]),
+        "nome_do_produto": doc.get("nome_do_produto"),
+        "qtade_maxima_armazenada": doc.get("qtade_maxima_armazenada"),
+        "url_download": doc.get("pdf_url")
+    }
+
+
+def pdf_visible_to(role, user_id, doc):
+    """
+    Aplica as regras de GET /pdfs a um único produto.
+    Retorna o produto no formato da resposta para o papel informado,
+    ou None se o usuário não pode vê-lo.
+    """
+    if not doc or doc.get("deleted_at") is not None or doc.get("pdf_url") is None:
+        return None
+
+    if role == ROLES['VIEWER']:
+        return catalog_entry(doc) if is_published(doc) else None
+    if role == ROLES['ANALYST']:
+        if doc.get("status") != "aprovado" and str(doc.get("created_by_user_id")) != str(user_id):
+            return None
+    elif role != ROLES['ADMIN']:
+        return None
+
+    p_data = dict(doc)
+    p_data['_id'] = str(p_data['_id'])
+    p_data['url_download'] = p_data.pop('pdf_url')
+    return p_data
+
+
+_catalog_built = False
+_catalog_lock = threading.Lock()
+
+
+def _catalog_exists():
+    """Indica se o catálogo já foi construído (resultado guardado após a primeira confirmação)."""
+    global _catalog_built
+    if not _catalog_built:
+        from app import get_db
+        names = get_db().list_collection_names(filter={"name": PublishedCatalog.collection_name})
+        _catalog_built = bool(names)
+    return _catalog_built
+
+
+def ensure_published_catalog():
+    """Constrói o catálogo publicado se ele ainda não existe (primeiro acesso após a implantação)."""
+    if _catalog_exists():
+        return
+    with _catalog_lock:
+        if not _catalog_exists():
+            total = rebuild_published_catalog()
+            logging.info(f"Catálogo publicado construído no primeiro acesso: {total} produtos.")
+
+
+def sync_published_catalog(old_doc, new_doc):
+    """
+    Atualiza a entrada do produto no catálogo publicado.
+    Use None para indicar criação (old_doc) ou exclusão (new_doc).
+    Só escreve quando o produto está ou estava publicado, e só depois que o catálogo
+    foi construído (antes disso o upsert criaria uma coleção parcial).
+    """
+    try:
+        if not _catalog_exists():
+            return
+        if is_published(new_doc):
+            entry = catalog_entry(new_doc)
+            PublishedCatalog.collection().replace_one({"_id": entry["_id"]}, entry, upsert=True)
+        elif is_published(old_doc):
+            PublishedCatalog.collection().delete_one({"_id": str(old_doc["_id"])})
+    except Exception:
+        logging.exception("Erro ao atualizar o catálogo publicado.")
+
+
+def read_published_catalog():
+    ensure_published_catalog()
+    return list(PublishedCatalog.collection().find({}))
+
+
+def rebuild_published_catalog():
+    """Recria o catálogo publicado com um pipeline $match/$project/$out."""
+    Product.collection().aggregate([
+        {"$match": Product.active({"status": "aprovado", "pdf_url": {"$exists": True, "$ne": None}})},
+        {"$project": {
+            "_id": {"$toString": "$_id"},
+            "nome_do_produto": 1,
+            "qtade_maxima_armazenada": 1,
+            "url_download": "$pdf_url"
+        }},
+        {"$out": PublishedCatalog.collection_name}
+    ])
+    # Sem produtos publicados o $out pode não criar a coleção; ela precisa existir para marcar o catálogo como construído
+    try:
+        from app import get_db
+        get_db().create_collection(PublishedCatalog.collection_name)
+    except CollectionInvalid:
+        pass
+    return PublishedCatalog.collection().count_documents({})
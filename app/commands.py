@@ -0,0 +1,68 @@
+# app/commands.py
+"""
+Comandos de manutenção disponíveis pelo CLI do Flask (ex.: flask rebuild-product-stats).
+"""
+import click
+
+
+def register_commands(app):
+
+    @app.cli.command('ensure-indexes')
+    def ensure_indexes_command():
+        """Cria os índices do MongoDB (os que falharem são listados)."""
+        from app import ensure_indexes
+
+        pending = ensure_indexes()
+        if pending:
+            raise click.ClickException(f"Índices não criados para: {', '.join(pending)}")
+        click.echo("Índices criados.")
+
+    @app.cli.command('rebuild-product-stats')
+    def rebuild_product_stats_command():
+        """Recalcula os contadores de GET /products/stats a partir da coleção de produtos."""
+        from app.stats import rebuild_product_stats
+
+        stats = rebuild_product_stats()
+        click.echo(f"Contadores recalculados: {stats['total']} produtos.")
+
+    @app.cli.command('rebuild-published-catalog')
+    def rebuild_published_catalog_command():
+        """Recria o catálogo publicado (VIEWER) a partir da coleção de produtos."""
+        from app.catalog import rebuild_published_catalog
+
+        total = rebuild_published_catalog()
+        click.echo(f"Catálogo publicado recriado: {total} produtos.")
+
+    @app.cli.command('reconcile-pdfs')
+    @click.option('--apply', 'apply_changes', is_flag=True,
+                  help="Remove de fato os itens órfãos (sem esta opção apenas simula).")
+    def reconcile_pdfs_command(apply_changes):
+        """Remove PDFs órfãos do S3, metadados sem produto e produtos excluídos há muito tempo."""
+        from app.reconciliation import reconcile_pdf_storage
+        from app.storage import get_pdf_metadata_collection, get_s3_bucket_name, get_s3_client
+
+        s3_client = get_s3_client()
+        if s3_client is None or get_s3_bucket_name() is None:
+            raise click.ClickException("Configuração do AWS S3 ausente ou inválida")
+
+        report = reconcile_pdf_storage(
+            s3_client, get_s3_bucket_name(), get_pdf_metadata_collection(), dry_run=not apply_changes
+        )
+        for key, value in report.items():
+            click.echo(f"{key}: {value}")
+
+    @app.cli.command('rebuild-storage-compatibility')
+    def rebuild_storage_compatibility_command():
+        """Recalcula os conflitos de compatibilidade GHS de todos os locais de armazenamento."""
+        from app.compatibility import rebuild_storage_compatibility
+
+        total = rebuild_storage_compatibility()
+        click.echo(f"Compatibilidade recalculada: {total} locais com conflitos.")
+
+    @app.cli.command('rebuild-storage-capacity')
+    def rebuild_storage_capacity_command():
+        """Normaliza as quantidades dos produtos e recalcula os totais de capacidade."""
+        from app.capacity import rebuild_capacity
+
+        total = rebuild_capacity()
+        click.echo(f"Capacidade recalculada: {total} totais.")
@@ -0,0 +1,306 @@
+# app/compatibility.py
+"""
+Compatibilidade de armazenamento GHS por local de armazenamento.
+
+Os perigos de cada produto (perigos_fisicos, perigos_saude, perigos_meio_ambiente)
+são convertidos em um bitset de classes GHS. A matriz de incompatibilidade é
+pré-calculada para todos os bitsets possíveis, então verificar um par de produtos
+é um único AND. Produtos com o mesmo bitset são agrupados, e só os grupos
+distintos de um local são comparados entre si.
+
+O resultado de cada local fica na coleção 'storage_conflicts'; as rotas de produto
+chamam check_locations() apenas para os locais afetados por cada escrita. A primeira
+leitura após a implantação recalcula todos os locais (ensure_storage_compatibility).
+"""
+import logging
+import re
+import threading
+import unicodedata
+from datetime import datetime
+
+from app.models import Product, RebuildState, StorageConflicts
+
+# Classes GHS (pictogramas GHS01 a GHS09), na ordem dos bits
+GHS_CLASSES = (
+    'explosivo',          # GHS01
+    'inflamavel',         # GHS02
+    'oxidante',           # GHS03
+    'gas_sob_pressao',    # GHS04
+    'corrosivo',          # GHS05
+    'toxico',             # GHS06
+    'irritante',          # GHS07
+    'perigo_a_saude',     # GHS08
+    'meio_ambiente',      # GHS09
+)
+GHS_BIT = {name: 1 << index for index, name in enumerate(GHS_CLASSES)}
+
+# Frases de perigo (H-statements) de cada classe GHS. H302/H312/H332 (nocivo) são GHS07;
+# H412, H413 e H362 não têm pictograma.
+H_STATEMENTS = {
+    'explosivo': ('200', '201', '202', '203', '204', '205', '240', '241'),
+    'inflamavel': ('220', '221', '222', '223', '224', '225', '226', '228', '230', '231', '232',
+                   '242', '250', '251', '252', '260', '261'),
+    'oxidante': ('270', '271', '272'),
+    'gas_sob_pressao': ('280', '281'),
+    'corrosivo': ('290', '314', '318'),
+    'toxico': ('300', '301', '310', '311', '330', '331'),
+    'irritante': ('302', '312', '315', '317', '319', '332', '335', '336'),
+    'perigo_a_saude': ('304', '334', '340', '341', '350', '351', '360', '361', '370', '371', '372', '373'),
+    'meio_ambiente': ('400', '410', '411'),
+}
+H_STATEMENT_CLASS = {code: name for name, codes in H_STATEMENTS.items() for code in codes}
+
+GHS_CODE_PATTERN = re.compile(r'\bghs\s?0?([1-9])\b')
+H_STATEMENT_PATTERN = re.compile(r'\bh\s?([2-4]\d{2})')
+
+# Trechos negados ("não inflamável", "sem risco de explosão") até a próxima pontuação
+NEGATION_PATTERN = re.compile(r'\b(?:nao|sem)\b[^,;.]*')
+CLAUSE_SEPARATORS = re.compile(r'[,;.\n]')
+
+# Termos (sem acento, minúsculos) que identificam cada classe no texto dos perigos,
+# usados quando o perigo não traz código GHS nem frase H.
+# Os termos de 'perigo_a_saude' vêm antes de 'toxico' para que "toxicidade para
+# órgãos-alvo" não seja lida como toxicidade aguda.
+GHS_KEYWORDS = (
+    ('explosivo', ('ghs01', 'explos', 'autorreativ', 'peroxido organico')),
+    ('inflamavel', ('ghs02', 'inflam', 'pirofor', 'autoaquec', 'em contato com a agua')),
+    ('oxidante', ('ghs03', 'oxidant', 'comburent')),
+    ('gas_sob_pressao', ('ghs04', 'sob pressao', 'gas comprimido', 'gas liquefeito', 'gas refrigerado')),
+    ('corrosivo', ('ghs05', 'corros')),
+    ('perigo_a_saude', ('ghs08', 'orgaos-alvo', 'orgao-alvo', 'carcinog', 'mutagen', 'reproduc',
+                        'sensibilizacao respirat', 'aspiracao')),
+    ('toxico', ('toxicidade aguda', 'toxico', 'fatal', 'letal')),
+    ('irritante', ('irrit', 'sensibilizacao a pele', 'sensibilizante', 'narcot')),
+    ('meio_ambiente', ('aquatic', 'meio ambiente', 'ambiente')),
+)
+
+# Toxicidade para organismos aquáticos é GHS09, não GHS06
+ENVIRONMENT_CONTEXT = ('aquatic', 'ambiente', 'organismos')
+
+# Pares de classes que não devem dividir o mesmo local (tabelas usuais de segregação)
+INCOMPATIBLE_PAIRS = (
+    ('explosivo', 'inflamavel'),
+    ('explosivo', 'oxidante'),
+    ('explosivo', 'gas_sob_pressao'),
+    ('explosivo', 'corrosivo'),
+    ('explosivo', 'toxico'),
+    ('inflamavel', 'oxidante'),
+    ('inflamavel', 'gas_sob_pressao'),
+    ('oxidante', 'corrosivo'),
+    ('oxidante', 'toxico'),
+    ('corrosivo', 'toxico'),
+)
+
+HAZARD_FIELDS = ('perigos_fisicos', 'perigos_saude', 'perigos_meio_ambiente')
+
+# Limite de pares listados por local (o total é sempre informado)
+MAX_PAIRS_PER_LOCATION = 500
+
+# Campos do produto copiados para cada conflito gravado (e usados na severidade)
+SUMMARY_FIELDS = ('codigo', 'nome_do_produto', 'palavra_de_perigo')
+
+REBUILD_NAME = 'storage_compatibility'
+_rebuilt = False
+_rebuild_lock = threading.Lock()
+
+
+def _build_incompatibility_table():
+    incompatible_with = [0] * len(GHS_CLASSES)
+    for a, b in INCOMPATIBLE_PAIRS:
+        incompatible_with[GHS_CLASSES.index(a)] |= GHS_BIT[b]
+        incompatible_with[GHS_CLASSES.index(b)] |= GHS_BIT[a]
+
+    # table[mask] = classes incompatíveis com qualquer classe presente em mask
+    table = [0] * (1 << len(GHS_CLASSES))
+    for mask in range(1, len(table)):
+        lowest = mask & -mask
+        table[mask] = table[mask ^ lowest] | incompatible_with[lowest.bit_length() - 1]
+    return table
+
+
+INCOMPATIBILITY_TABLE = _build_incompatibility_table()
+
+
+def _normalize(text):
+    text = unicodedata.normalize('NFKD', str(text)).encode('ascii', 'ignore').decode('ascii')
+    return text.lower()
+
+
+def _coded_mask(text):
+    """Classes indicadas por códigos GHS (GHS01..GHS09) ou frases H (H2xx/H3xx/H4xx)."""
+    mask = 0
+    for number in GHS_CODE_PATTERN.findall(text):
+        mask |= 1 << (int(number) - 1)
+    for code in H_STATEMENT_PATTERN.findall(text):
+        name = H_STATEMENT_CLASS.get(code)
+        if name:
+            mask |= GHS_BIT[name]
+    return mask
+
+
+def _keyword_mask(text, environment_field=False):
+    """Classes indicadas pelo texto livre, trecho a trecho, ignorando os trechos negados."""
+    mask = 0
+    for clause in CLAUSE_SEPARATORS.split(NEGATION_PATTERN.sub(' ', text)):
+        environmental = environment_field or any(term in clause for term in ENVIRONMENT_CONTEXT)
+        for name, keywords in GHS_KEYWORDS:
+            if name == 'toxico' and environmental:
+                continue
+            if any(keyword in clause for keyword in keywords):
+                mask |= GHS_BIT[name]
+                if name == 'perigo_a_saude':
+                    break
+    return mask
+
+
+def hazard_mask(doc):
+    """
+    Bitset das classes GHS de um produto a partir das listas de perigos.
+    Cada perigo é classificado pelos códigos GHS/frases H que contém; só sem código
+    algum o texto livre é usado.
+    """
+    mask = 0
+    for field in HAZARD_FIELDS:
+        for hazard in doc.get(field) or []:
+            text = _normalize(hazard)
+            mask |= _coded_mask(text) or _keyword_mask(text, field == 'perigos_meio_ambiente')
+    return mask
+
+
+def mask_classes(mask):
+    return [name for name in GHS_CLASSES if mask & GHS_BIT[name]]
+
+
+def conflicting_classes(mask_a, mask_b):
+    """Pares de classes (a, b) incompatíveis entre os dois bitsets."""
+    pairs = []
+    for name_a in mask_classes(mask_a):
+        for name_b in mask_classes(mask_b & INCOMPATIBILITY_TABLE[GHS_BIT[name_a]]):
+            pairs.append([name_a, name_b])
+    return pairs
+
+
+def _product_summary(doc):
+    return {
+        "id": str(doc["_id"]),
+        "codigo": doc.get("codigo"),
+        "nome_do_produto": doc.get("nome_do_produto"),
+        "palavra_de_perigo": doc.get("palavra_de_perigo"),
+    }
+
+
+def find_location_conflicts(docs):
+    """
+    Retorna (pares_em_conflito, total) para os produtos de um mesmo local.
+    Produtos com o mesmo bitset são agrupados e só os grupos são comparados.
+    """
+    groups = {}
+    for doc in docs:
+        mask = hazard_mask(doc)
+        if mask:
+            groups.setdefault(mask, []).append(_product_summary(doc))
+
+    conflicts = []
+    total = 0
+    masks = list(groups)
+    for i, mask_a in enumerate(masks):
+        for mask_b in masks[i:]:
+            if not mask_a & INCOMPATIBILITY_TABLE[mask_b]:
+                continue
+            classes = conflicting_classes(mask_a, mask_b)
+            products_a = groups[mask_a]
+            products_b = groups[mask_b]
+            if mask_a == mask_b:
+                pairs = ((products_a[x], products_a[y])
+                         for x in range(len(products_a)) for y in range(x + 1, len(products_a)))
+            else:
+                pairs = ((a, b) for a in products_a for b in products_b)
+            for product_a, product_b in pairs:
+                total += 1
+                if len(conflicts) < MAX_PAIRS_PER_LOCATION:
+                    conflicts.append({
+                        "produto_a": product_a,
+                        "produto_b": product_b,
+                        "classes": classes,
+                        "severidade": "alta" if "Perigo" in (product_a["palavra_de_perigo"], product_b["palavra_de_perigo"]) else "media"
+                    })
+    return conflicts, total
+
+
+def check_location(location):
+    """Recalcula e grava os conflitos de um local. Retorna o documento gravado."""
+    docs = Product.collection().find(
+        Product.active({"local_de_armazenamento": location}),
+        {"codigo": 1, "nome_do_produto": 1, "palavra_de_perigo": 1,
+         "perigos_fisicos": 1, "perigos_saude": 1, "perigos_meio_ambiente": 1}
+    )
+    conflicts, total = find_location_conflicts(docs)
+    result = {
+        "_id": location,
+        "local_de_armazenamento": location,
+        "total_conflitos": total,
+        "conflitos": conflicts,
+        "atualizado_em": datetime.utcnow()
+    }
+    if total:
+        StorageConflicts.collection().replace_one({"_id": location}, result, upsert=True)
+    else:
+        StorageConflicts.collection().delete_one({"_id": location})
+    return result
+
+
+def check_locations(old_doc, new_doc):
+    """
+    Reavalia só os locais afetados por uma escrita de produto (o antigo e o novo,
+    se mudou) e retorna os conflitos do local atual que envolvem o produto.
+    Falhas são apenas registradas; 'flask rebuild-storage-compatibility' refaz tudo.
+    """
+    locations = {doc.get("local_de_armazenamento") for doc in (old_doc, new_doc) if doc}
+    locations.discard(None)
+    # Sem mudança de local, de classes GHS nem dos campos copiados para os conflitos
+    # (a severidade depende de palavra_de_perigo), o resultado gravado continua válido
+    unchanged = (
+        old_doc and new_doc
+        and old_doc.get("local_de_armazenamento") == new_doc.get("local_de_armazenamento")
+        and all(old_doc.get(field) == new_doc.get(field) for field in SUMMARY_FIELDS)
+        and hazard_mask(old_doc) == hazard_mask(new_doc)
+    )
+    product_conflicts = []
+    try:
+        for location in locations:
+            if unchanged:
+                result = StorageConflicts.collection().find_one({"_id": location}) or {"conflitos": []}
+            else:
+                result = check_location(location)
+            if new_doc and location == new_doc.get("local_de_armazenamento"):
+                product_id = str(new_doc["_id"])
+                product_conflicts = [
+                    c for c in result["conflitos"]
+                    if product_id in (c["produto_a"]["id"], c["produto_b"]["id"])
+                ]
+    except Exception:
+        logging.exception("Erro ao verificar a compatibilidade de armazenamento.")
+    return product_conflicts
+
+
+def rebuild_storage_compatibility():
+    """Recalcula os conflitos de todos os locais. Retorna a quantidade de locais com conflito."""
+    StorageConflicts.collection().delete_many({})
+    with_conflicts = 0
+    for location in Product.collection().distinct("local_de_armazenamento", Product.active()):
+        if location and check_location(location)["total_conflitos"]:
+            with_conflicts += 1
+    RebuildState.mark_done(REBUILD_NAME)
+    return with_conflicts
+
+
+def ensure_storage_compatibility():
+    """Recalcula todos os locais se isso nunca foi feito (primeira leitura após a implantação)."""
+    global _rebuilt
+    if _rebuilt:
+        return
+    with _rebuild_lock:
+        if not _rebuilt and not RebuildState.is_done(REBUILD_NAME):
+            total = rebuild_storage_compatibility()
+            logging.info(f"Compatibilidade de armazenamento calculada no primeiro acesso: {total} locais com conflitos.")
+        _rebuilt = True
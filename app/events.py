@@ -0,0 +1,142 @@
+# app/events.py
+"""
+Feed de alterações de produtos (Server-Sent Events) baseado em change streams do MongoDB.
+
+Cada evento leva como 'id' o resume token do change stream; o navegador reenvia esse
+valor no cabeçalho Last-Event-ID ao reconectar e o feed continua de onde parou.
+
+Change streams exigem replica set. Para testar localmente com um nó só:
+    docker run -d -p 27017:27017 mongo:latest --replSet rs0
+    docker exec <container> mongosh --eval "rs.initiate()"
+"""
+import json
+from datetime import datetime
+
+from pymongo.errors import OperationFailure
+
+from app.models import Product
+from app.catalog import pdf_visible_to
+
+# Intervalo (segundos) entre comentários de keepalive quando não há alterações
+HEARTBEAT_SECONDS = 15
+
+# Tempo (ms) que o navegador espera antes de reconectar
+RETRY_MS = 3000
+
+CHANGE_PIPELINE = [
+    {"$match": {"operationType": {"$in": ["insert", "update", "replace", "delete"]}}}
+]
+
+
+class ChangeStreamUnavailable(Exception):
+    """O MongoDB não suporta change streams (não é replica set) ou o token expirou."""
+
+    def __init__(self, msg, status_code):
+        super().__init__(msg)
+        self.msg = msg
+        self.status_code = status_code
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+
+def _event_type(change):
+    operation = change["operationType"]
+    if operation == "insert":
+        return "criado"
+    if operation == "delete":
+        return "excluido"
+    updated_fields = (change.get("updateDescription") or {}).get("updatedFields") or {}
+    if "deleted_at" in updated_fields:
+        return "excluido"
+    if "status" in updated_fields:
+        return "status"
+    return "atualizado"
+
+
+def _format_event(change, role, user_id, sent_ids):
+    """
+    Monta o evento SSE da alteração, ou None se o usuário não deve recebê-la.
+    Um produto que deixou de ser visível só gera remoção se o usuário podia vê-lo antes:
+    pela pre-image da alteração ('fullDocumentBeforeChange') quando o MongoDB a fornece,
+    ou, sem ela, se o produto já foi enviado nesta conexão (sent_ids).
+    """
+    product_id = str(change["documentKey"]["_id"])
+    event_type = _event_type(change)
+    payload = pdf_visible_to(role, user_id, change.get("fullDocument"))
+
+    if payload is None:
+        before = change.get("fullDocumentBeforeChange")
+        if before is not None:
+            visible_before = pdf_visible_to(role, user_id, before) is not None
+        else:
+            visible_before = product_id in sent_ids
+        if not visible_before:
+            return None
+        sent_ids.discard(product_id)
+        # O produto deixou de ser visível (ou foi excluído): o cliente só precisa do ID para removê-lo
+        data = {"tipo": "removido" if event_type != "excluido" else "excluido", "id": product_id}
+    else:
+        sent_ids.add(product_id)
+        data = {"tipo": event_type, "id": product_id, "produto": payload}
+
+    return (
+        f"id: {change['_id']['_data']}\n"
+        f"event: produto\n"
+        f"data: {json.dumps(data, default=_json_default)}\n\n"
+    )
+
+
+def _watch(resume_token, pre_images):
+    options = {}
+    if pre_images:
+        # Requer MongoDB 6.0+ e changeStreamPreAndPostImages na coleção (Product.enable_pre_images)
+        options["full_document_before_change"] = 'whenAvailable'
+    return Product.collection().watch(
+        CHANGE_PIPELINE,
+        full_document='updateLookup',
+        resume_after={"_data": resume_token} if resume_token else None,
+        max_await_time_ms=HEARTBEAT_SECONDS * 1000,
+        **options
+    )
+
+
+def open_product_change_stream(resume_token=None):
+    """
+    Abre o change stream da coleção de produtos, opcionalmente a partir de um resume token.
+    Levanta ChangeStreamUnavailable se o servidor não suporta ou o token não pode ser usado.
+    """
+    try:
+        try:
+            return _watch(resume_token, pre_images=True)
+        except OperationFailure as e:
+            if e.code == 40573:
+                raise
+            # Servidor sem suporte a pre-images (MongoDB < 6.0): segue sem elas
+            return _watch(resume_token, pre_images=False)
+    except OperationFailure as e:
+        if e.code == 40573:
+            raise ChangeStreamUnavailable("Change streams exigem que o MongoDB rode como replica set.", 503)
+        if resume_token:
+            raise ChangeStreamUnavailable("Não foi possível retomar o feed a partir do último evento; recarregue a lista.", 410)
+        raise
+
+
+def product_events(stream, role, user_id):
+    """Gera o corpo SSE a partir de um change stream aberto, filtrando pelo papel do usuário."""
+    sent_ids = set()  # Produtos já enviados a este cliente
+    try:
+        yield f"retry: {RETRY_MS}\n\n"
+        while stream.alive:
+            change = stream.try_next()
+            if change is None:
+                yield ": keepalive\n\n"
+                continue
+            event = _format_event(change, role, user_id, sent_ids)
+            if event:
+                yield event
+    finally:
+        stream.close()
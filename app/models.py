@@ -1,5 +1,8 @@
+import os
 from datetime import datetime
 from bson.objectid import ObjectId
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from pymongo.errors import OperationFailure
 
 class User:
     collection_name = 'users'
@@ -51,18 +54,53 @@ class User:
 
     @classmethod
     def collection(cls):
-        from . import db
-        return db[cls.collection_name]
+        from . import get_db
+        return get_db()[cls.collection_name]
+
+    @classmethod
+    def ensure_indexes(cls):
+        # Índices únicos: a checagem de duplicidade em lote (/users/bulk) depende deles
+        cls.collection().create_index([("username", ASCENDING)], unique=True, name="uniq_username")
+        cls.collection().create_index([("email", ASCENDING)], unique=True, name="uniq_email")
+
+
+# Campos de produto filtráveis por igualdade em GET /products (listas de perigos: pertinência)
+PRODUCT_FILTER_FIELDS = (
+    'status', 'empresa', 'categoria', 'palavra_de_perigo', 'estado_fisico',
+    'local_de_armazenamento', 'perigos_fisicos', 'perigos_saude',
+    'perigos_meio_ambiente', 'created_by_user_id'
+)
+
+
+def _product_query_indexes():
+    # Cada combinação filtro/ordenação aceita por GET /products precisa de um destes índices
+    indexes = [
+        [('created_at', DESCENDING)],
+        [('updated_at', DESCENDING)],
+        [('nome_do_produto', ASCENDING)],
+        [('codigo', ASCENDING)],
+        [('status', ASCENDING), ('empresa', ASCENDING), ('_id', DESCENDING)],
+        [('empresa', ASCENDING), ('local_de_armazenamento', ASCENDING), ('_id', DESCENDING)],
+    ]
+    for field in PRODUCT_FILTER_FIELDS:
+        indexes.append([(field, ASCENDING), ('_id', DESCENDING)])
+        indexes.append([(field, ASCENDING), ('updated_at', DESCENDING)])
+    return indexes
 
 
 class Product:
     collection_name = 'products'
+    _field_names = None
+
+    # Índices declarados para as consultas do catálogo (o índice de _id já existe)
+    QUERY_INDEXES = _product_query_indexes()
 
     def __init__(self, codigo, qtade_maxima_armazenada, nome_do_produto, fornecedor,
                  estado_fisico, local_de_armazenamento, substancias,
                  palavra_de_perigo, categoria, status, created_by_user_id,
                  perigos_fisicos=None, perigos_saude=None, perigos_meio_ambiente=None,
-                 pdf_url=None, pdf_s3_key=None, empresa=None, _id=None, created_at=None):
+                 pdf_url=None, pdf_s3_key=None, empresa=None, _id=None, created_at=None,
+                 thumbnail_s3_key=None, page_count=None, qtade_normalizada=None, thumbnail_erro=None):
         self.codigo = codigo
         self.qtade_maxima_armazenada = qtade_maxima_armazenada
         self.nome_do_produto = nome_do_produto
@@ -79,6 +117,10 @@ class Product:
         self.created_by_user_id = created_by_user_id
         self.pdf_url = pdf_url
         self.pdf_s3_key = pdf_s3_key
+        self.thumbnail_s3_key = thumbnail_s3_key
+        self.page_count = page_count
+        self.thumbnail_erro = thumbnail_erro
+        self.qtade_normalizada = qtade_normalizada
         self.empresa = empresa
         self._id = _id
         self.created_at = created_at if created_at is not None else datetime.utcnow()
@@ -101,6 +143,10 @@ class Product:
             "created_by_user_id": str(self.created_by_user_id) if self.created_by_user_id else None,  # 👈 fix
             "pdf_url": self.pdf_url,
             "pdf_s3_key": self.pdf_s3_key,
+            "thumbnail_s3_key": self.thumbnail_s3_key,
+            "page_count": self.page_count,
+            "thumbnail_erro": self.thumbnail_erro,
+            "qtade_normalizada": self.qtade_normalizada,
             "empresa": self.empresa,
             "created_at": self.created_at.isoformat() if isinstance(self.created_at, datetime) else self.created_at
         }
@@ -136,10 +182,148 @@ class Product:
             pdf_s3_key=data.get('pdf_s3_key'),
             empresa=data.get('empresa'),
             _id=data.get('_id'),
-            created_at=created_at_data
+            created_at=created_at_data,
+            thumbnail_s3_key=data.get('thumbnail_s3_key'),
+            page_count=data.get('page_count'),
+            thumbnail_erro=data.get('thumbnail_erro'),
+            qtade_normalizada=data.get('qtade_normalizada')
         )
 
+    @classmethod
+    def ensure_indexes(cls):
+        indexes = [IndexModel(keys) for keys in cls.QUERY_INDEXES]
+        # Usado pela limpeza de produtos excluídos logicamente (app/reconciliation.py)
+        indexes.append(IndexModel([('deleted_at', ASCENDING)], sparse=True))
+        cls.collection().create_indexes(indexes)
+
+    @classmethod
+    def enable_pre_images(cls):
+        # Pre-images no change stream: o feed SSE (app/events.py) sabe se o produto era visível antes
+        from . import get_db
+        get_db().command("collMod", cls.collection_name, changeStreamPreAndPostImages={"enabled": True})
+
+    @classmethod
+    def active(cls, query=None):
+        # Produtos excluídos logicamente têm 'deleted_at'; as consultas normais os ignoram
+        return dict(query or {}, deleted_at=None)
+
+    @classmethod
+    def field_names(cls):
+        # Atributos do modelo, na forma como são gravados no MongoDB
+        if cls._field_names is None:
+            cls._field_names = frozenset(cls.from_dict({}).to_dict())
+        return cls._field_names
+
     @classmethod
     def collection(cls):
-        from . import db
-        return db[cls.collection_name]
+        from . import get_db
+        return get_db()[cls.collection_name]
+
+
+class ProductStats:
+    """
+    Documento único com os contadores agregados do catálogo de produtos
+    (por status, empresa, categoria e palavra de perigo).
+    """
+    collection_name = 'product_stats'
+    document_id = 'produtos'
+
+    @classmethod
+    def collection(cls):
+        from . import get_db
+        return get_db()[cls.collection_name]
+
+
+class PublishedCatalog:
+    """
+    Catálogo publicado para o papel VIEWER: apenas produtos aprovados com PDF,
+    já no formato retornado por GET /pdfs.
+    """
+    collection_name = 'published_catalog'
+
+    @classmethod
+    def collection(cls):
+        from . import get_db
+        return get_db()[cls.collection_name]
+
+
+class StorageConflicts:
+    """Conflitos de compatibilidade GHS por local de armazenamento (_id = local)."""
+    collection_name = 'storage_conflicts'
+
+    @classmethod
+    def collection(cls):
+        from . import get_db
+        return get_db()[cls.collection_name]
+
+
+class RebuildState:
+    """
+    Marca as coleções derivadas que já foram recalculadas por completo pelo menos uma vez
+    (_id = nome do recálculo, ex.: 'storage_compatibility'), para que sejam construídas
+    automaticamente na primeira leitura após a implantação.
+    """
+    collection_name = 'rebuild_state'
+
+    @classmethod
+    def collection(cls):
+        from . import get_db
+        return get_db()[cls.collection_name]
+
+    @classmethod
+    def is_done(cls, name):
+        return cls.collection().count_documents({"_id": name}, limit=1) > 0
+
+    @classmethod
+    def mark_done(cls, name):
+        cls.collection().replace_one({"_id": name}, {"_id": name, "recalculado_em": datetime.utcnow()}, upsert=True)
+
+
+class StorageCapacity:
+    """Totais de capacidade por (dimensão, chave, unidade), mantidos por app/capacity.py."""
+    collection_name = 'storage_capacity'
+
+    @classmethod
+    def collection(cls):
+        from . import get_db
+        return get_db()[cls.collection_name]
+
+    @classmethod
+    def ensure_indexes(cls):
+        cls.collection().create_index([("dimensao", ASCENDING), ("chave", ASCENDING), ("unidade", ASCENDING)])
+
+
+class IdempotencyKey:
+    """
+    Primeira resposta de cada Idempotency-Key (por usuário e rota).
+    Os registros expiram pelo índice TTL em 'created_at'. Um registro 'em_andamento'
+    cujo prazo ('lease_until') venceu foi abandonado (processo encerrado no meio) e
+    pode ser assumido por uma nova tentativa.
+    """
+    collection_name = 'idempotency_keys'
+
+    # Lidos na chamada, não na importação: o .env só é carregado em create_app()
+    @classmethod
+    def ttl_seconds(cls):
+        return int(os.environ.get('IDEMPOTENCY_TTL_SECONDS', 24 * 60 * 60))
+
+    @classmethod
+    def lease_seconds(cls):
+        return int(os.environ.get('IDEMPOTENCY_LEASE_SECONDS', 10 * 60))
+
+    @classmethod
+    def collection(cls):
+        from . import get_db
+        return get_db()[cls.collection_name]
+
+    @classmethod
+    def ensure_indexes(cls):
+        ttl_seconds = cls.ttl_seconds()
+        try:
+            cls.collection().create_index([("created_at", ASCENDING)], expireAfterSeconds=ttl_seconds)
+        except OperationFailure as e:
+            if e.code != 85:  # IndexOptionsConflict: o índice já existe com outro TTL
+                raise
+            from . import get_db
+            get_db().command("collMod", cls.collection_name,
+                             index={"keyPattern": {"created_at": 1}, "expireAfterSeconds": ttl_seconds})
@@ -0,0 +1,165 @@
+# app/pdf_cache.py
+"""
+Cache em disco, com limite de tamanho (LRU), dos PDFs baixados do S3.
+
+Usado por GET /pdfs/<product_id>/file: a primeira leitura de um PDF baixa o
+objeto do S3 para PDF_CACHE_DIR e as seguintes (inteiras ou parciais, via Range)
+são servidas do disco. Cada chave S3 é única por upload, então o arquivo em
+cache nunca fica desatualizado; só sai do cache por falta de espaço.
+"""
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+PDF_CACHE_DIR = os.environ.get('PDF_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'quimicadocs_pdf_cache'))
+PDF_CACHE_MAX_BYTES = int(os.environ.get('PDF_CACHE_MAX_BYTES', 1024 * 1024 * 1024))
+
+# Downloads parciais (.part) mais antigos que isto foram abandonados (processo encerrado no meio)
+PART_FILE_MAX_AGE_SECONDS = 60 * 60
+
+
+class PdfDiskCache:
+    """
+    O diretório pode ser compartilhado por vários processos (workers do servidor WSGI):
+    o instante de modificação de cada arquivo marca o último uso, cada download novo
+    relê o diretório antes de aplicar o limite (que vale para o diretório inteiro), e um
+    arquivo removido por outro processo é simplesmente baixado de novo.
+    """
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # caminho -> tamanho, do menos para o mais recente
+        self._total_bytes = 0
+        self._downloads = {}  # caminho -> threading.Event de um download em andamento
+        self._lock = threading.Lock()
+
+        os.makedirs(directory, exist_ok=True)
+        with self._lock:
+            self._scan_directory()
+            self._evict()
+
+    def _scan_directory(self):
+        # Chamado com o lock adquirido. Recarrega os arquivos do diretório (deste e de outros
+        # processos), do uso mais antigo ao mais recente, e remove downloads abandonados
+        files = []
+        part_cutoff = time.time() - PART_FILE_MAX_AGE_SECONDS
+        for entry in os.scandir(self.directory):
+            try:
+                if not entry.is_file():
+                    continue
+                stat = entry.stat()
+                if entry.name.endswith('.pdf'):
+                    files.append((stat.st_mtime, entry.path, stat.st_size))
+                elif entry.name.endswith('.part') and stat.st_mtime < part_cutoff:
+                    os.remove(entry.path)
+            except FileNotFoundError:
+                continue  # Removido por outro processo durante a leitura
+        self._entries = OrderedDict((path, size) for _, path, size in sorted(files))
+        self._total_bytes = sum(self._entries.values())
+
+    def _path(self, s3_key):
+        return os.path.join(self.directory, hashlib.sha256(s3_key.encode('utf-8')).hexdigest() + '.pdf')
+
+    def _evict(self, keep=None):
+        # Chamado com o lock adquirido
+        while self._total_bytes > self.max_bytes and len(self._entries) > (1 if keep else 0):
+            path, size = next(iter(self._entries.items()))
+            if path == keep:
+                self._entries.move_to_end(path)
+                continue
+            self._discard_entry(path)
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def _discard_entry(self, path):
+        # Chamado com o lock adquirido
+        size = self._entries.pop(path, None)
+        if size is not None:
+            self._total_bytes -= size
+
+    def _touch(self, path):
+        """Marca o uso do arquivo (visível aos outros processos). Retorna False se ele não existe mais."""
+        try:
+            os.utime(path)
+            return True
+        except FileNotFoundError:
+            return False
+
+    def discard(self, s3_key):
+        """Esquece a entrada da chave (por exemplo, quando o arquivo foi removido por outro processo)."""
+        with self._lock:
+            self._discard_entry(self._path(s3_key))
+
+    def get_path(self, s3_client, bucket, s3_key):
+        """
+        Retorna o caminho local do PDF, baixando-o do S3 se necessário.
+        Downloads simultâneos da mesma chave (no mesmo processo) são feitos uma única vez.
+        """
+        path = self._path(s3_key)
+        while True:
+            with self._lock:
+                if path in self._entries:
+                    if self._touch(path):
+                        self._entries.move_to_end(path)
+                        return path
+                    # Removido do disco por outro processo: baixa de novo
+                    self._discard_entry(path)
+                elif self._touch(path):
+                    # Baixado por outro processo
+                    try:
+                        self._entries[path] = os.path.getsize(path)
+                        self._total_bytes += self._entries[path]
+                        return path
+                    except FileNotFoundError:
+                        pass
+                download = self._downloads.get(path)
+                if download is None:
+                    download = threading.Event()
+                    self._downloads[path] = download
+                    break
+            # Outro thread está baixando o mesmo arquivo: espera e verifica de novo
+            download.wait()
+
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.part')
+            try:
+                with os.fdopen(fd, 'wb') as tmp_file:
+                    s3_client.download_fileobj(bucket, s3_key, tmp_file)
+                os.replace(tmp_path, path)
+            except BaseException:
+                os.remove(tmp_path)
+                raise
+
+            size = os.path.getsize(path)
+            with self._lock:
+                # O limite vale para o diretório inteiro, inclusive os arquivos de outros processos
+                self._scan_directory()
+                self._entries[path] = size
+                self._entries.move_to_end(path)
+                self._evict(keep=path)
+            logging.info(f"PDF {s3_key} armazenado no cache local ({size} bytes).")
+            return path
+        finally:
+            with self._lock:
+                self._downloads.pop(path, None)
+            download.set()
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_pdf_cache():
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = PdfDiskCache(PDF_CACHE_DIR, PDF_CACHE_MAX_BYTES)
+    return _cache
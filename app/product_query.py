@@ -0,0 +1,104 @@
+# app/product_query.py
+"""
+Filtros e ordenação de GET /products.
+
+Parâmetros aceitos:
+    ?status=, ?empresa=, ?categoria=, ?palavra_de_perigo=, ?estado_fisico=,
+    ?local_de_armazenamento=         igualdade
+    ?perigos_fisicos=, ?perigos_saude=, ?perigos_meio_ambiente=
+                                     produto cuja lista contém o valor
+    ?created_by=<id do usuário>      criador do produto
+    ?created_at_de=, ?created_at_ate=, ?updated_at_de=, ?updated_at_ate=
+                                     intervalo de datas (ISO 8601)
+    ?sort=campo ou ?sort=-campo      ordenação (padrão: -_id)
+
+Toda combinação precisa ser atendida por um índice de Product.QUERY_INDEXES
+(igualdades, depois o campo de ordenação, que também é o único campo de intervalo
+permitido); as demais são recusadas para nunca cair em collection scan.
+"""
+from datetime import datetime
+
+from app.models import Product, PRODUCT_FILTER_FIELDS
+
+# Parâmetro da URL -> campo do documento
+FILTER_PARAMS = {field: field for field in PRODUCT_FILTER_FIELDS if field != 'created_by_user_id'}
+FILTER_PARAMS['created_by'] = 'created_by_user_id'
+
+RANGE_FIELDS = ('created_at', 'updated_at')
+
+SORT_FIELDS = ('_id', 'created_at', 'updated_at', 'nome_do_produto', 'codigo')
+
+DEFAULT_SORT = [('_id', -1)]
+
+
+def _parse_datetime(value):
+    return datetime.fromisoformat(value.replace('Z', '+00:00'))
+
+
+def find_supporting_index(equality_fields, range_field, sort_field):
+    """
+    Procura um índice declarado que atenda à consulta: as igualdades formam o prefixo
+    (em qualquer ordem) e a chave seguinte é o campo de ordenação, que também deve ser
+    o campo de intervalo, se houver. Retorna as chaves do índice ou None.
+    """
+    if range_field and range_field != sort_field:
+        return None
+
+    equality = set(equality_fields)
+    for keys in [[('_id', -1)]] + Product.QUERY_INDEXES:
+        names = [name for name, _ in keys]
+        prefix, rest = names[:len(equality)], names[len(equality):]
+        if set(prefix) == equality and rest and rest[0] == sort_field:
+            return keys
+    return None
+
+
+def build_product_query(args):
+    """
+    Monta (query, sort, erro) a partir dos parâmetros da requisição.
+    'erro' é uma mensagem para resposta 400, ou None.
+    """
+    query = {}
+    for param, field in FILTER_PARAMS.items():
+        value = (args.get(param) or '').strip()
+        if value:
+            query[field] = value
+
+    range_field = None
+    for field in RANGE_FIELDS:
+        bounds = {}
+        for suffix, operator in (('_de', '$gte'), ('_ate', '$lte')):
+            value = args.get(field + suffix)
+            if not value:
+                continue
+            try:
+                bounds[operator] = _parse_datetime(value)
+            except ValueError:
+                return None, None, f"Data inválida em '{field + suffix}'. Use o formato ISO 8601."
+        if bounds:
+            if range_field:
+                return None, None, "Use intervalo de datas em apenas um campo (created_at ou updated_at)."
+            range_field = field
+            query[field] = bounds
+
+    sort_param = (args.get('sort') or '').strip()
+    if sort_param:
+        sort_field = sort_param.lstrip('-')
+        if sort_field not in SORT_FIELDS:
+            return None, None, f"Ordenação inválida. Use: {', '.join(SORT_FIELDS)} (prefixo '-' para decrescente)."
+        sort = [(sort_field, -1 if sort_param.startswith('-') else 1)]
+    elif range_field:
+        # Com intervalo de datas, a ordenação padrão passa a ser pelo próprio campo
+        sort = [(range_field, -1)]
+    else:
+        sort = DEFAULT_SORT
+
+    equality_fields = [field for field in query if field != range_field]
+    if find_supporting_index(equality_fields, range_field, sort[0][0]) is None:
+        return None, None, (
+            "Combinação de filtros e ordenação sem índice correspondente. "
+            "Use um filtro (ou status+empresa, empresa+local_de_armazenamento) com ordenação por _id "
+            "ou updated_at, e intervalos de datas apenas no campo de ordenação."
+        )
+
+    return query, sort, None
@@ -0,0 +1,223 @@
+# app/ratelimit.py
+"""
+Controle de admissão das rotas autenticadas, aplicado por role_required:
+
+- limite de taxa (token bucket) por usuário e rota, com capacidade e reposição
+  definidas por papel (RATE_LIMITS, chaves iguais aos valores de ROLES);
+- limite de requisições simultâneas por rota (max_concurrent no decorador),
+  para rotas caras como upload, exportação e pacote ZIP.
+
+O estado fica em memória do processo. Com RATE_LIMIT_REDIS_URL definido (e o
+pacote 'redis' instalado), os token buckets passam a ser compartilhados entre
+processos/containers via Redis; os limites de concorrência continuam por processo,
+pois protegem os recursos (conexões, threads) do próprio processo.
+
+O limite de taxa é verificado antes de qualquer consulta ao MongoDB, com o papel lido
+do claim 'role' do JWT (gravado no login). Tokens sem o claim usam o maior limite configurado.
+
+RATE_LIMITS e ROUTE_CONCURRENCY podem ser sobrescritos por variáveis de ambiente em JSON
+(cada papel sobrescreve só os campos informados; valores inválidos são ignorados):
+    RATE_LIMITS='{"visualizador": {"capacidade": 30, "por_segundo": 0.5}}'
+    ROUTE_CONCURRENCY='{"pdf_routes.get_pdf_bundle": 2}'
+"""
+import json
+import logging
+import math
+import os
+import threading
+import time
+
+from app.utils import ROLES
+
+# Por papel: rajada máxima (capacidade) e reposição de fichas por segundo
+DEFAULT_RATE_LIMITS = {
+    ROLES['ADMIN']: {"capacidade": 120, "por_segundo": 2.0},
+    ROLES['ANALYST']: {"capacidade": 60, "por_segundo": 1.0},
+    ROLES['VIEWER']: {"capacidade": 60, "por_segundo": 1.0},
+}
+
+# Acima deste número de buckets em memória, os que já estão cheios (ociosos) são descartados
+MAX_BUCKETS = 10000
+
+
+def _load_json_env(name):
+    raw = os.environ.get(name)
+    if not raw:
+        return {}
+    try:
+        return json.loads(raw)
+    except ValueError:
+        logging.error(f"{name} não é um JSON válido; usando os valores padrão.")
+        return {}
+
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def _load_rate_limits():
+    """Mescla cada papel de RATE_LIMITS sobre o padrão e valida os valores."""
+    limits = {role: dict(values) for role, values in DEFAULT_RATE_LIMITS.items()}
+    overrides = _load_json_env('RATE_LIMITS')
+    if not isinstance(overrides, dict):
+        logging.error("RATE_LIMITS deve ser um objeto JSON por papel; usando os valores padrão.")
+        return limits
+    for role, override in overrides.items():
+        merged = dict(limits.get(role, {}), **(override if isinstance(override, dict) else {}))
+        capacity, rate = merged.get("capacidade"), merged.get("por_segundo")
+        if not (_is_number(capacity) and capacity >= 1 and _is_number(rate) and rate > 0):
+            logging.error(f"RATE_LIMITS inválido para o papel '{role}': {override}; mantendo o padrão.")
+            continue
+        limits[role] = merged
+    return limits
+
+
+def _load_route_concurrency():
+    overrides = _load_json_env('ROUTE_CONCURRENCY')
+    if not isinstance(overrides, dict):
+        logging.error("ROUTE_CONCURRENCY deve ser um objeto JSON por rota; ignorado.")
+        return {}
+    valid = {}
+    for endpoint, limit in overrides.items():
+        if isinstance(limit, int) and not isinstance(limit, bool) and limit > 0:
+            valid[endpoint] = limit
+        else:
+            logging.error(f"ROUTE_CONCURRENCY inválido para a rota '{endpoint}': {limit}; ignorado.")
+    return valid
+
+
+RATE_LIMITS = _load_rate_limits()
+ROUTE_CONCURRENCY = _load_route_concurrency()
+
+# Limite aplicado a tokens sem o claim 'role' (emitidos antes dele existir): o mais generoso
+FALLBACK_RATE_LIMIT = max(RATE_LIMITS.values(), key=lambda limits: limits["por_segundo"])
+
+
+class LocalTokenBuckets:
+    """Token buckets em memória do processo."""
+
+    def __init__(self):
+        # chave -> (fichas, instante da última atualização, capacidade, reposição por segundo)
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def take(self, key, capacity, rate):
+        """Consome uma ficha. Retorna 0 se permitido, ou os segundos até haver uma ficha."""
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated, _, _ = self._buckets.get(key, (capacity, now, capacity, rate))
+            tokens = min(capacity, tokens + (now - updated) * rate)
+            if tokens >= 1:
+                tokens -= 1
+                wait = 0
+            else:
+                wait = (1 - tokens) / rate
+            self._buckets[key] = (tokens, now, capacity, rate)
+            if len(self._buckets) > MAX_BUCKETS:
+                self._prune(now)
+            return wait
+
+    def _prune(self, now):
+        # Cada bucket é comparado com a própria capacidade e reposição (variam por papel)
+        self._buckets = {
+            key: (tokens, updated, capacity, rate)
+            for key, (tokens, updated, capacity, rate) in self._buckets.items()
+            if tokens + (now - updated) * rate < capacity
+        }
+
+
+class RedisTokenBuckets:
+    """Token buckets compartilhados no Redis (atualização atômica via script Lua)."""
+
+    _SCRIPT = """
+    local capacity = tonumber(ARGV[1])
+    local rate = tonumber(ARGV[2])
+    local now = tonumber(ARGV[3])
+    local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+    local tokens = tonumber(bucket[1]) or capacity
+    local updated = tonumber(bucket[2]) or now
+    tokens = math.min(capacity, tokens + math.max(0, now - updated) * rate)
+    local wait = 0
+    if tokens >= 1 then
+        tokens = tokens - 1
+    else
+        wait = (1 - tokens) / rate
+    end
+    redis.call('HSET', KEYS[1], 'tokens', tokens, 'updated', now)
+    redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 1)
+    return tostring(wait)
+    """
+
+    def __init__(self, url):
+        import redis  # Dependência opcional, só carregada quando RATE_LIMIT_REDIS_URL está definido
+
+        self._client = redis.Redis.from_url(url)
+        self._script = self._client.register_script(self._SCRIPT)
+
+    def take(self, key, capacity, rate):
+        return float(self._script(keys=[f"ratelimit:{key}"], args=[capacity, rate, time.time()]))
+
+
+_local_buckets = LocalTokenBuckets()
+_shared_buckets = None
+_shared_lock = threading.Lock()
+_semaphores = {}
+_semaphores_lock = threading.Lock()
+
+
+def _buckets():
+    """Backend dos token buckets: Redis se configurado e disponível, senão memória local."""
+    global _shared_buckets
+    url = os.environ.get('RATE_LIMIT_REDIS_URL')
+    if not url:
+        return _local_buckets
+    if _shared_buckets is None:
+        with _shared_lock:
+            if _shared_buckets is None:
+                try:
+                    _shared_buckets = RedisTokenBuckets(url)
+                except Exception as e:
+                    logging.error(f"Redis indisponível para o limite de taxa, usando memória local: {e}")
+                    _shared_buckets = _local_buckets
+    return _shared_buckets
+
+
+def check_rate_limit(user_id, role, endpoint):
+    """Retorna 0 se a requisição é admitida, ou os segundos a esperar (Retry-After)."""
+    limits = RATE_LIMITS.get(role) or FALLBACK_RATE_LIMIT
+    key = f"{user_id}:{endpoint}"
+    capacity, rate = limits["capacidade"], limits["por_segundo"]
+    try:
+        return _buckets().take(key, capacity, rate)
+    except Exception:
+        # Falha do backend compartilhado não pode derrubar a rota
+        logging.exception("Erro no limite de taxa compartilhado; usando memória local.")
+        return _local_buckets.take(key, capacity, rate)
+
+
+def acquire_slot(endpoint, max_concurrent):
+    """
+    Ocupa uma vaga de execução simultânea da rota. Retorna a função que libera
+    a vaga, ou None se a rota já está no limite.
+    """
+    limit = ROUTE_CONCURRENCY.get(endpoint, max_concurrent)
+    if not limit:
+        return lambda: None
+    with _semaphores_lock:
+        semaphore = _semaphores.get(endpoint)
+        if semaphore is None:
+            semaphore = _semaphores[endpoint] = threading.BoundedSemaphore(limit)
+    if not semaphore.acquire(blocking=False):
+        return None
+
+    released = threading.Event()
+
+    def release():
+        if not released.is_set():
+            released.set()
+            semaphore.release()
+    return release
+
+
+def retry_after_header(seconds):
+    return str(max(1, math.ceil(seconds)))
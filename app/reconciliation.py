@@ -0,0 +1,220 @@
+# app/reconciliation.py
+"""
+Limpeza de PDFs órfãos no S3 e de metadados de upload sem produto.
+
+Executado periodicamente (cron) pelo comando 'flask reconcile-pdfs', em modo de
+simulação por padrão ('--apply' para remover de fato). Etapas:
+    1. remove definitivamente os produtos excluídos logicamente há mais de
+       GC_TOMBSTONE_RETENTION_DAYS dias;
+    2. monta o conjunto de chaves S3 referenciadas pelos produtos restantes, por
+       'pdf_s3_key' ou pela chave extraída de 'pdf_url' (só as chaves ficam em
+       memória, não os documentos);
+    3. percorre a listagem do S3 (PDFs e miniaturas) página a página e remove, em lotes de 1000
+       com delete_objects, os objetos sem referência;
+    4. remove os metadados de upload cujo arquivo não é referenciado.
+Arquivos mais novos que GC_GRACE_HOURS são preservados, pois o upload é feito
+antes da associação ao produto.
+"""
+import logging
+import os
+import re
+from datetime import datetime, timedelta, timezone
+
+from app.models import Product
+from app.storage import s3_key_from_url
+from app.thumbnails import THUMBNAIL_PREFIX, thumbnail_key
+
+# Limite de chaves por chamada de delete_objects (máximo da API do S3)
+DELETE_BATCH_SIZE = 1000
+
+# Prefixos analisados: PDFs enviados por /upload e suas miniaturas
+SWEEP_PREFIXES = ('uploads/', THUMBNAIL_PREFIX)
+
+GRACE_HOURS = int(os.environ.get('GC_GRACE_HOURS', 24))
+TOMBSTONE_RETENTION_DAYS = int(os.environ.get('GC_TOMBSTONE_RETENTION_DAYS', 30))
+
+# Quantidade de exemplos listados no relatório
+REPORT_SAMPLE_SIZE = 20
+
+
+def _batches(iterable, size):
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _purge_tombstones(report, dry_run):
+    cutoff = datetime.utcnow() - timedelta(days=TOMBSTONE_RETENTION_DAYS)
+    cursor = Product.collection().find({"deleted_at": {"$lt": cutoff}}, {"_id": 1})
+    for batch in _batches((doc["_id"] for doc in cursor), DELETE_BATCH_SIZE):
+        report["produtos_purgados"] += len(batch)
+        if not dry_run:
+            Product.collection().delete_many({"_id": {"$in": batch}})
+
+
+def _referenced_keys(bucket, purged_before=None):
+    """
+    Chaves S3 referenciadas por produtos (ativos ou ainda dentro da retenção).
+    Produtos criados ou editados só com 'pdf_url' também contam: a chave é extraída da URL.
+    Retorna (referenciadas, referenciadas apenas pela URL).
+    """
+    conditions = [{"$or": [{"pdf_s3_key": {"$ne": None}}, {"pdf_url": {"$ne": None}}]}]
+    if purged_before:
+        conditions.append({"$or": [{"deleted_at": None}, {"deleted_at": {"$gte": purged_before}}]})
+    by_key = set()
+    by_url = set()
+    projection = {"pdf_s3_key": 1, "pdf_url": 1, "_id": 0}
+    for doc in Product.collection().find({"$and": conditions}, projection):
+        if doc.get("pdf_s3_key"):
+            by_key.add(doc["pdf_s3_key"])
+        url_key = s3_key_from_url(doc.get("pdf_url"), bucket)
+        if url_key:
+            by_url.add(url_key)
+    referenced = by_key | by_url
+    referenced |= {thumbnail_key(key) for key in referenced}
+    return referenced, by_url - by_key
+
+
+def _delete_s3_batch(s3_client, bucket, keys, report):
+    response = s3_client.delete_objects(
+        Bucket=bucket,
+        Delete={"Objects": [{"Key": key} for key in keys], "Quiet": True}
+    )
+    errors = response.get("Errors", [])
+    report["objetos_removidos"] += len(keys) - len(errors)
+    report["falhas_remocao"] += len(errors)
+    for error in errors:
+        logging.error(f"Erro ao remover {error.get('Key')} do S3: {error.get('Message')}")
+
+
+def _sweep_s3(s3_client, bucket, referenced, url_only, report, dry_run):
+    """
+    Percorre o bucket e remove os objetos não referenciados. Os objetos referenciados
+    apenas por 'pdf_url' são preservados e listados no relatório para correção do produto.
+    Retorna as chaves referenciadas que não existem no S3 (links quebrados).
+    """
+    grace_cutoff = datetime.now(timezone.utc) - timedelta(hours=GRACE_HOURS)
+    # Miniaturas podem ainda não ter sido geradas: só os PDFs contam como links quebrados
+    # (e só os dos prefixos percorridos; URLs podem apontar para outras pastas do bucket)
+    missing = {
+        key for key in referenced
+        if key.startswith(SWEEP_PREFIXES) and not key.startswith(THUMBNAIL_PREFIX)
+    }
+    pending = []
+
+    paginator = s3_client.get_paginator('list_objects_v2')
+    pages = (page for prefix in SWEEP_PREFIXES for page in paginator.paginate(Bucket=bucket, Prefix=prefix))
+    for page in pages:
+        for obj in page.get("Contents", []):
+            key = obj["Key"]
+            report["objetos_analisados"] += 1
+            if key in referenced:
+                missing.discard(key)
+                if key in url_only:
+                    report["objetos_so_por_url"] += 1
+                    if len(report["exemplos_so_por_url"]) < REPORT_SAMPLE_SIZE:
+                        report["exemplos_so_por_url"].append(key)
+                continue
+            if obj["LastModified"] >= grace_cutoff:
+                continue
+
+            report["objetos_orfaos"] += 1
+            report["bytes_orfaos"] += obj.get("Size", 0)
+            if len(report["exemplos_orfaos"]) < REPORT_SAMPLE_SIZE:
+                report["exemplos_orfaos"].append(key)
+
+            pending.append(key)
+            if len(pending) >= DELETE_BATCH_SIZE:
+                if not dry_run:
+                    _delete_s3_batch(s3_client, bucket, pending, report)
+                pending = []
+
+    if pending and not dry_run:
+        _delete_s3_batch(s3_client, bucket, pending, report)
+
+    return missing
+
+
+def _sweep_metadata(metadata_collection, referenced, report, dry_run):
+    grace_cutoff = datetime.utcnow() - timedelta(hours=GRACE_HOURS)
+    cursor = metadata_collection.find(
+        {"uploaded_at": {"$lt": grace_cutoff}},
+        {"s3_file_key": 1}
+    )
+    orphans = (doc["_id"] for doc in cursor if doc.get("s3_file_key") not in referenced)
+    for batch in _batches(orphans, DELETE_BATCH_SIZE):
+        report["metadados_orfaos"] += len(batch)
+        if not dry_run:
+            result = metadata_collection.delete_many({"_id": {"$in": batch}})
+            report["metadados_removidos"] += result.deleted_count
+
+
+def reconcile_pdf_storage(s3_client, bucket, metadata_collection, dry_run=True):
+    """
+    Executa a reconciliação e retorna um relatório com as contagens.
+    Com dry_run=True nada é removido: o relatório mostra o que seria feito.
+    """
+    report = {
+        "dry_run": dry_run,
+        "produtos_purgados": 0,
+        "objetos_analisados": 0,
+        "objetos_orfaos": 0,
+        "bytes_orfaos": 0,
+        "objetos_removidos": 0,
+        "falhas_remocao": 0,
+        "metadados_orfaos": 0,
+        "metadados_removidos": 0,
+        "referencias_quebradas": 0,
+        "objetos_so_por_url": 0,
+        "exemplos_orfaos": [],
+        "exemplos_referencias_quebradas": [],
+        "exemplos_so_por_url": [],
+    }
+
+    _purge_tombstones(report, dry_run)
+
+    # Em simulação os produtos vencidos continuam no banco: desconsidera-os mesmo assim
+    retention_cutoff = datetime.utcnow() - timedelta(days=TOMBSTONE_RETENTION_DAYS)
+    referenced, url_only = _referenced_keys(bucket, purged_before=retention_cutoff)
+
+    missing = _sweep_s3(s3_client, bucket, referenced, url_only, report, dry_run)
+    report["referencias_quebradas"] = len(missing)
+    report["exemplos_referencias_quebradas"] = sorted(missing)[:REPORT_SAMPLE_SIZE]
+
+    if metadata_collection is not None:
+        _sweep_metadata(metadata_collection, referenced, report, dry_run)
+
+    logging.info(f"Reconciliação de PDFs concluída: {report}")
+    return report
+
+
+def delete_replaced_pdf(s3_client, bucket, metadata_collection, s3_key):
+    """
+    Remove um PDF substituído (e sua miniatura e metadados) se nenhum outro produto
+    o usa. Chamado em segundo plano após o upload de um novo PDF para o produto;
+    se falhar, a reconciliação periódica remove o arquivo depois.
+    """
+    try:
+        # Produtos gravados só com 'pdf_url' também referenciam o arquivo
+        in_use = {"$or": [
+            {"pdf_s3_key": s3_key},
+            {"pdf_url": {"$regex": re.escape(f"/{s3_key}") + "$"}}
+        ]}
+        if Product.collection().count_documents(in_use, limit=1):
+            return False
+        s3_client.delete_objects(
+            Bucket=bucket,
+            Delete={"Objects": [{"Key": s3_key}, {"Key": thumbnail_key(s3_key)}], "Quiet": True}
+        )
+        if metadata_collection is not None:
+            metadata_collection.delete_many({"s3_file_key": s3_key})
+        logging.info(f"PDF substituído removido do S3: {s3_key}")
+        return True
+    except Exception:
+        logging.exception(f"Erro ao remover o PDF substituído {s3_key}.")
+        return False
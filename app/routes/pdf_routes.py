@@ -1,11 +1,12 @@
 import os
 import logging
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, Response, send_file, stream_with_context
 from flask_cors import CORS
-import boto3
-from dotenv import load_dotenv
-from pymongo import MongoClient
+from pymongo import ReturnDocument
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import re
+import time
 import uuid
 from flask_jwt_extended import get_jwt_identity # Necessário para obter a identidade do usuário logado
 from bson.objectid import ObjectId # Necessário para buscar usuário e produto por ID
@@ -13,9 +14,14 @@ from bson.objectid import ObjectId # Necessário para buscar usuário e produto
 # Importa as classes User e Product
 from app.models import User, Product
 # Importa o decorador role_required e a constante ROLES
-from app.utils import ROLES, role_required
-
-load_dotenv()
+from app.utils import ROLES, role_required, idempotent
+from app.catalog import read_published_catalog, pdf_visible_to, sync_published_catalog
+from app.pdf_cache import get_pdf_cache
+from app.thumbnails import THUMBNAIL_CACHE_CONTROL, recorded_thumbnail_failure, schedule_thumbnail, thumbnail_key
+from app.streaming import stream_zip
+from app.stats import apply_product_stats
+from app.reconciliation import delete_replaced_pdf
+from app.storage import get_aws_region, get_pdf_metadata_collection, get_s3_bucket_name, get_s3_client, product_pdf_key
 
 # Configurar logging
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
@@ -23,54 +29,83 @@ logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(
 pdf_bp = Blueprint('pdf_routes', __name__)
 CORS(pdf_bp)
 
-# --- Configurar AWS S3 ---
-aws_access_key_id = os.getenv('AWS_ACCESS_KEY_ID')
-aws_secret_access_key = os.getenv('AWS_SECRET_ACCESS_KEY')
-aws_region = os.getenv('AWS_REGION')
-s3_bucket_name = os.getenv('S3_BUCKET_NAME')
-
-s3_client = None
-try:
-    s3_client = boto3.client(
-        's3',
-        aws_access_key_id=aws_access_key_id,
-        aws_secret_access_key=aws_secret_access_key,
-        region_name=aws_region
-    )
-    logging.info("Cliente AWS S3 inicializado com sucesso.")
-except Exception as e:
-    logging.error(f"Erro ao inicializar o cliente AWS S3: {e}")
-
-# --- Configurar MongoDB para metadados de PDF (ainda usado por /upload) ---
-mongo_uri = os.getenv('MONGO_URI')
-mongo_db_name = os.getenv('MONGO_DB_NAME')
-mongo_pdf_collection_name = os.getenv('MONGO_COLLECTION_NAME')
-
-mongo_client = None
-pdf_metadata_collection = None # Renomeado para maior clareza
-try:
-    mongo_client = MongoClient(mongo_uri)
-    pdf_metadata_collection = mongo_client[mongo_db_name][mongo_pdf_collection_name]
-    logging.info(f"Conexão MongoDB estabelecida para metadados de PDF no DB '{mongo_db_name}' e coleção '{mongo_pdf_collection_name}'.")
-except Exception as e:
-    logging.error(f"Erro ao conectar ao MongoDB para metadados de PDF: {e}")
+# --- Limites do pacote ZIP de PDFs (/pdfs/bundle) ---
+PDF_BUNDLE_MAX_FILES = int(os.getenv('PDF_BUNDLE_MAX_FILES', 500))
+PDF_BUNDLE_MAX_BYTES = int(os.getenv('PDF_BUNDLE_MAX_BYTES', 500 * 1024 * 1024))
+PDF_BUNDLE_MAX_FILE_BYTES = int(os.getenv('PDF_BUNDLE_MAX_FILE_BYTES', 50 * 1024 * 1024))
+PDF_BUNDLE_TIMEOUT_SECONDS = int(os.getenv('PDF_BUNDLE_TIMEOUT_SECONDS', 300))
+PDF_BUNDLE_WORKERS = int(os.getenv('PDF_BUNDLE_WORKERS', 4))
+PDF_BUNDLE_CHUNK_SIZE = 64 * 1024
+PDF_BUNDLE_MAX_CONCURRENT = int(os.getenv('PDF_BUNDLE_MAX_CONCURRENT', 2))
 
-@pdf_bp.route('/upload', methods=['POST'])
-@role_required([ROLES['ADMIN']]) # Apenas administradores podem fazer upload
-def upload_file():
+# Uploads simultâneos por processo (banda de envio ao S3)
+UPLOAD_MAX_CONCURRENT = int(os.getenv('UPLOAD_MAX_CONCURRENT', 4))
+
+# Remoção em segundo plano dos PDFs substituídos por /products/<id>/pdf
+_cleanup_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='pdf_cleanup')
+
+def _upload_config():
     """
-    Endpoint para fazer upload de arquivos para o AWS S3 e armazenar seus metadados no MongoDB.
-    Somente administradores podem realizar este upload.
+    Cliente S3, bucket e coleção de metadados usados pelos uploads.
+    Retorna (s3_client, bucket, coleção, None) ou (None, None, None, resposta de erro).
     """
-    logging.info("Recebendo requisição de upload de arquivo...")
+    s3_client = get_s3_client()
+    s3_bucket_name = get_s3_bucket_name()
+    pdf_metadata_collection = get_pdf_metadata_collection()
 
     if s3_client is None or s3_bucket_name is None:
         logging.error("AWS S3 não está configurado corretamente. Verifique as variáveis de ambiente.")
-        return jsonify({"error": "Configuração do AWS S3 ausente ou inválida"}), 500
+        return None, None, None, (jsonify({"error": "Configuração do AWS S3 ausente ou inválida"}), 500)
 
     if pdf_metadata_collection is None:
         logging.error("MongoDB (coleção de metadados de PDF) não está configurado corretamente. Verifique as variáveis de ambiente e a conexão.")
-        return jsonify({"error": "Configuração do MongoDB para metadados de PDF ausente ou inválida"}), 500
+        return None, None, None, (jsonify({"error": "Configuração do MongoDB para metadados de PDF ausente ou inválida"}), 500)
+
+    return s3_client, s3_bucket_name, pdf_metadata_collection, None
+
+
+def _store_upload(file, s3_client, s3_bucket_name, pdf_metadata_collection, **metadata):
+    """
+    Envia o arquivo ao S3 com uma chave única e grava os metadados do upload.
+    Levanta S3UploadFailedError (ou outra exceção) se o envio falhar; se a gravação
+    dos metadados falhar, o objeto fica órfão e é removido pela reconciliação.
+    Retorna (chave S3, URL, ID dos metadados, instante do upload).
+    """
+    original_file_name = file.filename
+    file_key = f"uploads/{uuid.uuid4()}{os.path.splitext(original_file_name)[1]}"
+
+    logging.info(f"Iniciando upload do arquivo original: {original_file_name} (S3 key: {file_key}) para o bucket {s3_bucket_name}")
+    s3_client.upload_fileobj(file, s3_bucket_name, file_key)
+
+    file_url = f"https://{s3_bucket_name}.s3.{get_aws_region()}.amazonaws.com/{file_key}"
+    logging.info(f"Upload realizado com sucesso para S3! URL: {file_url}")
+
+    # Este registro é apenas para rastrear o upload do arquivo em si
+    uploaded_at = datetime.utcnow()
+    insert_result = pdf_metadata_collection.insert_one({
+        "original_filename": original_file_name,
+        "s3_file_key": file_key,
+        "url": file_url,
+        "uploaded_at": uploaded_at,
+        "uploaded_by_user_id": get_jwt_identity(), # Registra quem fez o upload
+        **metadata
+    })
+    return file_key, file_url, str(insert_result.inserted_id), uploaded_at
+
+
+@pdf_bp.route('/upload', methods=['POST'])
+@role_required([ROLES['ADMIN']], max_concurrent=UPLOAD_MAX_CONCURRENT) # Apenas administradores podem fazer upload
+@idempotent # Repetições com o mesmo Idempotency-Key não geram um novo objeto no S3
+def upload_file():
+    """
+    Endpoint para fazer upload de arquivos para o AWS S3 e armazenar seus metadados no MongoDB.
+    Somente administradores podem realizar este upload.
+    """
+    logging.info("Recebendo requisição de upload de arquivo...")
+
+    s3_client, s3_bucket_name, pdf_metadata_collection, error = _upload_config()
+    if error:
+        return error
 
     if 'file' not in request.files:
         logging.error("Nenhum arquivo foi enviado na requisição.")
@@ -81,41 +116,14 @@ def upload_file():
         logging.warning("Usuário enviou um arquivo sem nome.")
         return jsonify({"error": "Nenhum arquivo selecionado"}), 400
 
-    try:
-        original_file_name = file.filename
-        file_extension = os.path.splitext(original_file_name)[1]
-        unique_s3_file_name = f"{uuid.uuid4()}{file_extension}"
-        file_key = f"uploads/{unique_s3_file_name}"
-
-        logging.info(f"Iniciando upload do arquivo original: {original_file_name} (S3 key: {file_key}) para o bucket {s3_bucket_name}")
-        
-        s3_client.upload_fileobj(file, s3_bucket_name, file_key)
-        
-        file_url = f"https://{s3_bucket_name}.s3.{aws_region}.amazonaws.com/{file_key}"
-
-        if not file_url:
-            logging.error("Falha ao obter URL do arquivo do S3.")
-            return jsonify({"error": "Erro ao obter URL do arquivo"}), 500
-
-        logging.info(f"Upload realizado com sucesso para S3! URL: {file_url}")
+    from boto3.exceptions import S3UploadFailedError  # boto3 já carregado por get_s3_client()
 
-        # --- Armazenamento de metadados no MongoDB (coleção de metadados de PDF) ---
-        # Este registro é apenas para rastrear o upload do arquivo em si.
-        # A associação com um produto e seu status deve ser feita na rota de produtos.
-        logging.info(f"Inserindo metadados do upload no MongoDB para o arquivo: {original_file_name}")
-
-        pdf_document_metadata = {
-            "original_filename": original_file_name,
-            "s3_file_key": file_key,
-            "url": file_url,
-            "uploaded_at": datetime.utcnow(),
-            "uploaded_by_user_id": get_jwt_identity() # Registra quem fez o upload
-        }
-        
-        insert_result = pdf_metadata_collection.insert_one(pdf_document_metadata)
-        inserted_id = str(insert_result.inserted_id)
+    try:
+        file_key, file_url, inserted_id, _ = _store_upload(file, s3_client, s3_bucket_name, pdf_metadata_collection)
+        logging.info(f"Arquivo '{file.filename}' e metadados armazenados no MongoDB com ID: {inserted_id}.")
 
-        logging.info(f"Arquivo '{original_file_name}' e metadados armazenados no MongoDB com ID: {inserted_id}.")
+        # Gera a miniatura da primeira página em segundo plano
+        schedule_thumbnail(s3_client, s3_bucket_name, file_key, pdf_metadata_collection)
 
         # A URL retornada pode ser usada para atualizar um documento de produto existente
         # ou para criar um novo produto que a utilize.
@@ -124,16 +132,99 @@ def upload_file():
             "url": file_url,
             "s3_file_key": file_key, # Retorna a chave S3 também, útil para delete
             "id": inserted_id,
-            "original_filename": original_file_name
+            "original_filename": file.filename
         }), 200
 
-    except boto3.exceptions.S3UploadFailedError as e:
+    except S3UploadFailedError as e:
         logging.exception(f"Erro ao enviar arquivo para o S3: {e}")
         return jsonify({"error": f"Erro ao enviar arquivo para S3: {str(e)}"}), 500
     except Exception as e:
         logging.exception("Erro inesperado durante o upload ou armazenamento no MongoDB.")
         return jsonify({"error": f"Erro inesperado: {str(e)}"}), 500
 
+# --- Endpoint para enviar o PDF e associá-lo ao produto em uma única requisição ---
+@pdf_bp.route('/products/<product_id>/pdf', methods=['POST'])
+@role_required([ROLES['ADMIN']], max_concurrent=UPLOAD_MAX_CONCURRENT) # Mesma permissão de /upload
+@idempotent
+def upload_product_pdf(product_id):
+    """
+    Faz o upload do PDF (campo 'file') para o S3, registra os metadados e associa o
+    arquivo ao produto com uma única atualização atômica. O PDF anterior do produto,
+    se houver, é removido em segundo plano.
+    """
+    s3_client, s3_bucket_name, pdf_metadata_collection, error = _upload_config()
+    if error:
+        return error
+
+    try:
+        _id = ObjectId(product_id)
+    except Exception:
+        return jsonify({"error": "ID do produto inválido"}), 400
+
+    if 'file' not in request.files or request.files['file'].filename == '':
+        return jsonify({"error": "Nenhum arquivo enviado"}), 400
+
+    # Verificação barata antes do envio: um ID inexistente não deve custar um upload inteiro.
+    # A atualização abaixo continua filtrando por Product.active (exclusão concorrente).
+    if not Product.collection().count_documents(Product.active({"_id": _id}), limit=1):
+        return jsonify({"error": "Produto não encontrado"}), 404
+
+    file = request.files['file']
+    original_file_name = file.filename
+
+    try:
+        file_key, file_url, metadata_id, now = _store_upload(
+            file, s3_client, s3_bucket_name, pdf_metadata_collection, product_id=product_id
+        )
+    except Exception as e:
+        logging.exception("Erro ao enviar arquivo para o S3.")
+        return jsonify({"error": f"Erro ao enviar arquivo para S3: {str(e)}"}), 500
+
+    try:
+        # A associação ao produto é uma única operação: não há janela com o produto meio atualizado
+        new_fields = {
+            "pdf_url": file_url,
+            "pdf_s3_key": file_key,
+            "thumbnail_s3_key": None,
+            "page_count": None,
+            "thumbnail_erro": None,
+            "updated_at": now
+        }
+        previous = Product.collection().find_one_and_update(
+            Product.active({"_id": _id}),
+            {"$set": new_fields},
+            return_document=ReturnDocument.BEFORE
+        )
+    except Exception as e:
+        logging.exception("Erro ao associar o PDF ao produto no MongoDB.")
+        _cleanup_executor.submit(delete_replaced_pdf, s3_client, s3_bucket_name, pdf_metadata_collection, file_key)
+        return jsonify({"error": f"Erro inesperado: {str(e)}"}), 500
+
+    if previous is None:
+        # Excluído entre a verificação e a associação
+        _cleanup_executor.submit(delete_replaced_pdf, s3_client, s3_bucket_name, pdf_metadata_collection, file_key)
+        return jsonify({"error": "Produto não encontrado"}), 404
+
+    updated = dict(previous, **new_fields)
+    apply_product_stats(previous, updated)
+    sync_published_catalog(previous, updated)
+    schedule_thumbnail(s3_client, s3_bucket_name, file_key, pdf_metadata_collection)
+
+    old_key = previous.get("pdf_s3_key")
+    if old_key and old_key != file_key:
+        _cleanup_executor.submit(delete_replaced_pdf, s3_client, s3_bucket_name, pdf_metadata_collection, old_key)
+
+    logging.info(f"PDF '{original_file_name}' ({file_key}) associado ao produto {product_id}.")
+    return jsonify({
+        "message": "Arquivo enviado e associado ao produto com sucesso.",
+        "url": file_url,
+        "s3_file_key": file_key,
+        "id": str(metadata_id),
+        "original_filename": original_file_name,
+        "product_id": product_id,
+        "pdf_anterior_substituido": bool(old_key and old_key != file_key)
+    }), 200
+
 # --- Endpoint para listar PDFs (agora busca de Produtos e filtra por role) ---
 @pdf_bp.route('/pdfs', methods=['GET'])
 @role_required([ROLES['ADMIN'], ROLES['ANALYST'], ROLES['VIEWER']]) # Todos podem acessar, mas com filtro
@@ -158,14 +249,15 @@ def get_pdfs():
 
     # Lógica de filtragem e projeção baseada no papel do usuário
     if current_user.role == ROLES['VIEWER']:
-        query_filter["status"] = "aprovado"
-        # Visualizador vê apenas nome do produto, qtade_maxima_armazenada, e url do PDF
-        projection = {
-            "_id": 1, # ID do produto
-            "nome_do_produto": 1,
-            "qtade_maxima_armazenada": 1,
-            "pdf_url": 1 # Assumindo que a URL do PDF está neste campo no modelo Product
-        }
+        # Visualizador lê o catálogo publicado (app/catalog.py): só produtos aprovados com PDF,
+        # já com os campos nome_do_produto, qtade_maxima_armazenada e url_download
+        try:
+            products_with_pdfs = read_published_catalog()
+            logging.info(f"Retornando {len(products_with_pdfs)} documentos PDF/produtos do catálogo publicado.")
+            return jsonify(products_with_pdfs), 200
+        except Exception as e:
+            logging.exception("Erro ao buscar o catálogo publicado no MongoDB.")
+            return jsonify({"error": f"Erro ao listar PDFs: {str(e)}"}), 500
     elif current_user.role == ROLES['ANALYST']:
         query_filter["$or"] = [
             {"status": "aprovado"},
@@ -183,7 +275,7 @@ def get_pdfs():
     try:
         products_with_pdfs = []
         # Realiza a consulta na coleção de Produtos
-        products_cursor = Product.collection().find(query_filter, projection)
+        products_cursor = Product.collection().find(Product.active(query_filter), projection)
         
         for p_data in products_cursor:
             # Converte ObjectId para string para JSON
@@ -199,7 +291,298 @@ def get_pdfs():
         logging.exception("Erro ao buscar PDFs/produtos no MongoDB.")
         return jsonify({"error": f"Erro ao listar PDFs: {str(e)}"}), 500
 
+# --- Endpoint da miniatura (primeira página) do PDF de um produto ---
+@pdf_bp.route('/pdfs/<product_id>/thumbnail', methods=['GET'])
+@role_required([ROLES['ADMIN'], ROLES['ANALYST'], ROLES['VIEWER']])
+def get_pdf_thumbnail(product_id):
+    """
+    Retorna a miniatura PNG da primeira página do PDF do produto, com as mesmas
+    regras de acesso de /pdfs. Se a miniatura ainda não existe, agenda a geração
+    e responde 202; se a renderização do PDF já falhou, responde 404 sem tentar de novo.
+    """
+    s3_client = get_s3_client()
+    s3_bucket_name = get_s3_bucket_name()
+    if s3_client is None or s3_bucket_name is None:
+        logging.error("AWS S3 não está configurado corretamente. Verifique as variáveis de ambiente.")
+        return jsonify({"error": "Configuração do AWS S3 ausente ou inválida"}), 500
+
+    try:
+        _id = ObjectId(product_id)
+    except Exception:
+        return jsonify({"error": "ID do produto inválido"}), 400
+
+    current_user_id_str = get_jwt_identity()
+    current_user = User.from_dict(User.collection().find_one({"_id": ObjectId(current_user_id_str)}))
+
+    product = Product.collection().find_one(Product.active({"_id": _id}))
+    if pdf_visible_to(current_user.role, current_user_id_str, product) is None:
+        return jsonify({"error": "PDF não encontrado"}), 404
+    # Produtos gravados só com 'pdf_url' também têm o PDF no bucket
+    pdf_key = product_pdf_key(product, s3_bucket_name)
+    if not pdf_key:
+        return jsonify({"error": "Produto sem PDF armazenado no S3"}), 404
+    if product.get("thumbnail_erro"):
+        return jsonify({"error": "Não foi possível gerar a miniatura deste PDF"}), 404
+
+    thumb_key = product.get("thumbnail_s3_key") or thumbnail_key(pdf_key)
+    etag = os.path.splitext(os.path.basename(thumb_key))[0]
+
+    # A chave nunca muda de conteúdo: com o ETag correspondente nem é preciso ir ao S3
+    if product.get("thumbnail_s3_key") and etag in request.if_none_match:
+        response = Response(status=304)
+    else:
+        try:
+            s3_object = s3_client.get_object(Bucket=s3_bucket_name, Key=thumb_key)
+        except s3_client.exceptions.NoSuchKey:
+            pdf_metadata_collection = get_pdf_metadata_collection()
+            # A falha pode ter sido registrada no upload, antes de o PDF ser associado ao produto
+            failure = recorded_thumbnail_failure(pdf_key, pdf_metadata_collection)
+            if failure:
+                Product.collection().update_one({"_id": _id}, {"$set": {"thumbnail_erro": failure}})
+                return jsonify({"error": "Não foi possível gerar a miniatura deste PDF"}), 404
+            schedule_thumbnail(s3_client, s3_bucket_name, pdf_key, pdf_metadata_collection)
+            return jsonify({"message": "Miniatura em processamento"}), 202, {"Retry-After": "5"}
+        except Exception as e:
+            logging.exception("Erro ao buscar a miniatura no S3.")
+            return jsonify({"error": f"Erro ao buscar miniatura: {str(e)}"}), 500
+
+        # Miniatura gerada antes de o PDF ser associado ao produto: grava a referência agora
+        if not product.get("thumbnail_s3_key"):
+            page_count = s3_object.get("Metadata", {}).get("page-count")
+            Product.collection().update_one({"_id": _id}, {"$set": {
+                "thumbnail_s3_key": thumb_key,
+                "page_count": int(page_count) if page_count else None
+            }})
+
+        response = Response(s3_object["Body"].read(), mimetype='image/png')
+        response = response.make_conditional(request)
+
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = THUMBNAIL_CACHE_CONTROL
+    return response
+
+# --- Download do PDF de um produto via cache local (com suporte a Range) ---
+@pdf_bp.route('/pdfs/<product_id>/file', methods=['GET'])
+@role_required([ROLES['ADMIN'], ROLES['ANALYST'], ROLES['VIEWER']])
+def get_pdf_file(product_id):
+    """
+    Serve o PDF do produto a partir do cache em disco (preenchido do S3 na primeira leitura),
+    com as mesmas regras de acesso de /pdfs. Suporta Range/If-Range e entrega por sendfile
+    quando o servidor WSGI oferece wsgi.file_wrapper.
+    """
+    s3_client = get_s3_client()
+    s3_bucket_name = get_s3_bucket_name()
+    if s3_client is None or s3_bucket_name is None:
+        logging.error("AWS S3 não está configurado corretamente. Verifique as variáveis de ambiente.")
+        return jsonify({"error": "Configuração do AWS S3 ausente ou inválida"}), 500
+
+    try:
+        _id = ObjectId(product_id)
+    except Exception:
+        return jsonify({"error": "ID do produto inválido"}), 400
+
+    current_user_id_str = get_jwt_identity()
+    current_user = User.from_dict(User.collection().find_one({"_id": ObjectId(current_user_id_str)}))
+
+    product = Product.collection().find_one(Product.active({"_id": _id}))
+    if pdf_visible_to(current_user.role, current_user_id_str, product) is None:
+        return jsonify({"error": "PDF não encontrado"}), 404
+    # Produtos gravados só com 'pdf_url' também têm o PDF no bucket
+    pdf_key = product_pdf_key(product, s3_bucket_name)
+    if not pdf_key:
+        return jsonify({"error": "Produto sem PDF armazenado no S3"}), 404
+
+    # O conteúdo de uma chave S3 nunca muda: a própria chave serve de ETag
+    etag = os.path.splitext(os.path.basename(pdf_key))[0]
+    if etag in request.if_none_match:
+        response = Response(status=304)
+        response.set_etag(etag)
+        return response
+
+    # Duas tentativas: o arquivo pode sair do cache (deste ou de outro processo) entre a busca e a abertura
+    pdf_cache = get_pdf_cache()
+    for attempt in range(2):
+        try:
+            path = pdf_cache.get_path(s3_client, s3_bucket_name, pdf_key)
+            response = send_file(
+                path,
+                mimetype='application/pdf',
+                download_name=f"{product.get('codigo') or product_id}.pdf",
+                conditional=True,
+                etag=etag,
+                max_age=3600
+            )
+            break
+        except FileNotFoundError:
+            if attempt:
+                raise
+            pdf_cache.discard(pdf_key)
+        except s3_client.exceptions.ClientError as e:
+            logging.exception("Erro ao baixar o PDF do S3.")
+            return jsonify({"error": f"Erro ao baixar PDF: {str(e)}"}), 502
+
+    response.headers["Cache-Control"] = "private, max-age=3600"
+    return response
+
+# --- Pacote ZIP com os PDFs aprovados de uma empresa/local ---
+def _bundle_entry_name(product, used_names):
+    """Caminho do PDF no ZIP: '<local>/<codigo> - <nome>.pdf', sem caracteres problemáticos."""
+    def clean(text):
+        return re.sub(r'[\\/:*?"<>|\x00-\x1f]+', '_', str(text)).strip() or 'sem_nome'
+
+    folder = clean(product.get("local_de_armazenamento") or "sem_local")
+    base = clean(f"{product.get('codigo') or product['_id']} - {product.get('nome_do_produto') or ''}")
+    name = f"{folder}/{base}.pdf"
+    counter = 2
+    while name in used_names:
+        name = f"{folder}/{base} ({counter}).pdf"
+        counter += 1
+    used_names.add(name)
+    return name
+
+
+def _open_bundle_pdf(product, s3_client, s3_bucket_name):
+    """
+    Executado no pool: abre o objeto no S3 (get_object) sem ler o corpo.
+    O corpo é lido depois, direto para a entrada do ZIP, sem passar pelo disco.
+    """
+    pdf_key = product_pdf_key(product, s3_bucket_name)
+    if not pdf_key:
+        # pdf_url aponta para fora do bucket: o produto fica listado no LEIA-ME
+        return product, None, f"PDF fora do bucket da aplicação ({product.get('pdf_url')})"
+    try:
+        obj = s3_client.get_object(Bucket=s3_bucket_name, Key=pdf_key)
+        return product, obj, None
+    except Exception as e:
+        logging.exception(f"Erro ao obter o PDF {pdf_key} para o pacote ZIP.")
+        return product, None, str(e)
+
+
+def _body_chunks(body, label, errors):
+    """Blocos do corpo do objeto S3; uma falha no meio encerra a entrada e é registrada no LEIA-ME."""
+    try:
+        for chunk in body.iter_chunks(PDF_BUNDLE_CHUNK_SIZE):
+            yield chunk
+    except Exception as e:
+        logging.exception(f"Erro ao ler o PDF {label} do S3 para o pacote ZIP.")
+        errors.append(f"{label}: arquivo incompleto no pacote ({e})")
+    finally:
+        body.close()
+
+
+def _close_opened_pdf(future):
+    _, obj, _ = future.result()
+    if obj:
+        obj["Body"].close()
+
+
+def _bundle_entries(products, s3_client, s3_bucket_name):
+    """
+    Abre os objetos no S3 em paralelo (pool limitado, no máximo um objeto aberto à frente por thread)
+    e copia o corpo de cada um para a entrada do ZIP, bloco a bloco. O tamanho vem do
+    ContentLength, então os limites são verificados antes de ler qualquer byte.
+    """
+    deadline = time.monotonic() + PDF_BUNDLE_TIMEOUT_SECONDS
+    executor = ThreadPoolExecutor(max_workers=PDF_BUNDLE_WORKERS, thread_name_prefix='pdf_bundle')
+    products = iter(products)
+    pending = set()
+    used_names = set()
+    errors = []
+    total_bytes = 0
+
+    def submit_next():
+        product = next(products, None)
+        if product is not None:
+            pending.add(executor.submit(_open_bundle_pdf, product, s3_client, s3_bucket_name))
+
+    try:
+        for _ in range(PDF_BUNDLE_WORKERS):
+            submit_next()
+
+        while pending:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                errors.append("Tempo limite atingido: o pacote está incompleto.")
+                break
+            done, _ = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+            for future in done:
+                pending.discard(future)
+                submit_next()
+                product, obj, error = future.result()
+                label = product.get("codigo") or str(product["_id"])
+                if error:
+                    errors.append(f"{label}: erro ao baixar o PDF ({error})")
+                    continue
+                size = obj.get("ContentLength") or 0
+                if size > PDF_BUNDLE_MAX_FILE_BYTES or total_bytes + size > PDF_BUNDLE_MAX_BYTES:
+                    obj["Body"].close()
+                    errors.append(f"{label}: ignorado por exceder o limite de tamanho do pacote")
+                    continue
+                total_bytes += size
+                # PDFs já são comprimidos: entram no ZIP sem nova compressão
+                yield _bundle_entry_name(product, used_names), _body_chunks(obj["Body"], label, errors), False
+    finally:
+        for future in pending:
+            # Objetos abertos (ou ainda abrindo) e não enviados: tempo limite ou cliente desconectado
+            if not future.cancel():
+                future.add_done_callback(_close_opened_pdf)
+        executor.shutdown(wait=False)
+
+    if errors:
+        yield "LEIA-ME_erros.txt", ["\n".join(errors).encode('utf-8')], True
+
+
+@pdf_bp.route('/pdfs/bundle', methods=['GET'])
+@role_required([ROLES['ADMIN'], ROLES['ANALYST'], ROLES['VIEWER']], max_concurrent=PDF_BUNDLE_MAX_CONCURRENT)
+def get_pdf_bundle():
+    """
+    Gera um ZIP com os PDFs de todos os produtos aprovados de uma empresa e/ou
+    local de armazenamento (?empresa=, ?local_de_armazenamento=), organizados por local.
+    O ZIP é enviado em streaming, sem arquivos temporários.
+    """
+    s3_client = get_s3_client()
+    s3_bucket_name = get_s3_bucket_name()
+    if s3_client is None or s3_bucket_name is None:
+        logging.error("AWS S3 não está configurado corretamente. Verifique as variáveis de ambiente.")
+        return jsonify({"error": "Configuração do AWS S3 ausente ou inválida"}), 500
+
+    empresa = request.args.get('empresa')
+    local = request.args.get('local_de_armazenamento')
+    if not empresa and not local:
+        return jsonify({"error": "Informe 'empresa' e/ou 'local_de_armazenamento'"}), 400
+
+    # Produtos gravados só com 'pdf_url' também entram (a chave é extraída da URL)
+    query_filter = {"status": "aprovado", "$or": [{"pdf_s3_key": {"$ne": None}}, {"pdf_url": {"$ne": None}}]}
+    if empresa:
+        query_filter["empresa"] = empresa
+    if local:
+        query_filter["local_de_armazenamento"] = local
+    query_filter = Product.active(query_filter)
+
+    try:
+        total = Product.collection().count_documents(query_filter)
+    except Exception as e:
+        logging.exception("Erro ao buscar produtos para o pacote ZIP.")
+        return jsonify({"error": f"Erro ao gerar pacote: {str(e)}"}), 500
+    if total == 0:
+        return jsonify({"error": "Nenhum PDF aprovado encontrado para o filtro informado"}), 404
+    if total > PDF_BUNDLE_MAX_FILES:
+        return jsonify({"error": f"O pacote teria {total} PDFs; o limite é {PDF_BUNDLE_MAX_FILES}. Refine o filtro."}), 413
+
+    products = Product.collection().find(
+        query_filter,
+        {"codigo": 1, "nome_do_produto": 1, "local_de_armazenamento": 1, "pdf_s3_key": 1, "pdf_url": 1}
+    )
+
+    filename = "fds_" + re.sub(r'[^A-Za-z0-9_-]+', '_', "_".join(v for v in (empresa, local) if v)) + ".zip"
+    logging.info(f"Gerando pacote ZIP com {total} PDFs ({filename}).")
+    return Response(
+        stream_with_context(stream_zip(_bundle_entries(products, s3_client, s3_bucket_name))),
+        mimetype='application/zip',
+        headers={'Content-Disposition': f'attachment; filename="{filename}"'}
+    )
+
 # O bloco if __name__ == "__main__": original (relacionado ao PostgreSQL)
-# foi removido, pois a conexão MongoDB é estabelecida globalmente quando o Blueprint
-# é carregado, e este arquivo será importado por sua aplicação Flask principal.
+# foi removido. O cliente S3 e a conexão MongoDB são criados no primeiro uso
+# (app/storage.py e app.get_db), não quando o Blueprint é carregado.
 
@@ -1,13 +1,23 @@
 # app/routes/product_routes.py
-from flask import request, jsonify, Blueprint
+from flask import request, jsonify, Blueprint, Response, stream_with_context
 from flask_jwt_extended import get_jwt_identity
 from bson.objectid import ObjectId
 from bson.errors import InvalidId
+from pymongo import ReturnDocument
 from datetime import datetime
+import csv
+import io
 import re
 
 from app.models import Product, User
-from app.utils import ROLES, role_required
+from app.utils import ROLES, role_required, idempotent
+from app.stats import apply_product_stats, read_product_stats
+from app.catalog import sync_published_catalog
+from app.product_query import build_product_query
+from app.compatibility import check_locations
+from app.capacity import apply_capacity, location_capacity_alerts, normalize_quantity
+from app.streaming import csv_safe, stream_xlsx
+from app.events import ChangeStreamUnavailable, open_product_change_stream, product_events
 
 product_bp = Blueprint('product', __name__)
 
@@ -24,7 +34,7 @@ def _serialize_dt(value):
     return value
 
 
-def _serialize_product(doc):
+def _serialize_product(doc, resolve_creator=True):
     if not doc:
         return {}
 
@@ -42,7 +52,7 @@ def _serialize_product(doc):
 
     # Nome do criador
     created_by_user_id = p.get("created_by_user_id")
-    if created_by_user_id:
+    if resolve_creator and created_by_user_id:
         try:
             _oid = created_by_user_id if isinstance(created_by_user_id, ObjectId) else ObjectId(created_by_user_id)
             user = User.collection().find_one({"_id": _oid})
@@ -56,6 +66,43 @@ def _serialize_product(doc):
     return p
 
 
+# Campos aceitos em ?fields= além dos atributos do modelo Product
+EXTRA_FIELDS = {'id', 'updated_at', 'created_by'}
+
+
+def _parse_fields():
+    """
+    Lê ?fields=campo1,campo2 e monta a projeção do MongoDB.
+    Retorna (projection, fields, erro); projection e fields são None quando
+    o parâmetro não foi enviado (documento completo).
+    """
+    raw = request.args.get('fields')
+    if not raw:
+        return None, None, None
+
+    fields = {f.strip() for f in raw.split(',') if f.strip()}
+    invalid = fields - (Product.field_names() | EXTRA_FIELDS)
+    if invalid:
+        return None, None, f"Campos inválidos em 'fields': {', '.join(sorted(invalid))}"
+
+    projection = {f: 1 for f in fields if f not in ('id', 'created_by')}
+    if 'created_by' in fields:
+        projection['created_by_user_id'] = 1
+    if not projection:
+        projection['_id'] = 1
+    return projection, fields, None
+
+
+def _serialize_fields(doc, fields):
+    """Serializa respeitando ?fields=; o nome do criador só é buscado se for pedido."""
+    if fields is None:
+        return _serialize_product(doc)
+    p = _serialize_product(doc, resolve_creator='created_by' in fields)
+    if 'created_by_user_id' not in fields:
+        p.pop('created_by_user_id', None)
+    return p
+
+
 # ============================================================
 # TEST ROUTE
 # ============================================================
@@ -64,6 +111,57 @@ def test_products():
     return jsonify({"msg": "API de produtos está ativa!"}), 200
 
 
+# ============================================================
+# STATS
+# ============================================================
+@product_bp.route('/products/stats', methods=['GET'])
+@role_required([ROLES['ADMIN'], ROLES['ANALYST']])
+def get_product_stats():
+    try:
+        return jsonify(read_product_stats()), 200
+    except Exception as e:
+        return jsonify({"msg": f"Erro ao buscar estatísticas dos produtos: {str(e)}"}), 500
+
+
+# ============================================================
+# EVENTS (SSE)
+# ============================================================
+
+# Conexões SSE abertas por processo (cada uma mantém um change stream e uma thread)
+EVENTS_MAX_CONCURRENT = 100
+
+@product_bp.route('/products/events', methods=['GET'])
+@role_required([ROLES['ADMIN'], ROLES['ANALYST'], ROLES['VIEWER']], max_concurrent=EVENTS_MAX_CONCURRENT,
+               locations=['headers', 'query_string'])
+def product_events_feed():
+    """
+    Feed SSE com criação, edição, mudança de status e exclusão de produtos,
+    filtrado pelas mesmas regras de GET /pdfs. Como o EventSource não envia
+    cabeçalhos, o token JWT também é aceito no parâmetro ?jwt= (só nesta rota).
+    """
+    current_user_id = get_jwt_identity()
+    try:
+        user_data = User.collection().find_one({"_id": ObjectId(current_user_id)}, {"role": 1})
+    except Exception:
+        return jsonify({"msg": "ID inválido."}), 400
+    role_value = user_data.get("role") if user_data else None
+
+    resume_token = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+
+    try:
+        stream = open_product_change_stream(resume_token)
+    except ChangeStreamUnavailable as e:
+        return jsonify({"msg": e.msg}), e.status_code
+    except Exception as e:
+        return jsonify({"msg": f"Erro ao abrir o feed de produtos: {str(e)}"}), 500
+
+    return Response(
+        stream_with_context(product_events(stream, role_value, current_user_id)),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+
 # ============================================================
 # NEXT PRODUCT CODE
 # ============================================================
@@ -93,6 +191,7 @@ def get_next_product_code():
 # ============================================================
 @product_bp.route('/products', methods=['POST'])
 @role_required([ROLES['ADMIN'], ROLES['ANALYST']])
+@idempotent
 def create_product():
     current_user_id = get_jwt_identity()
     try:
@@ -159,6 +258,7 @@ def create_product():
         pdf_url=data.get('pdf_url'),
         pdf_s3_key=data.get('pdf_s3_key'),
         empresa=data.get('empresa'),
+        qtade_normalizada=normalize_quantity(data.get('qtade_maxima_armazenada')),
     )
 
     try:
@@ -170,12 +270,18 @@ def create_product():
         new_product._id = result.inserted_id
 
         product_dict["_id"] = new_product._id
+        apply_product_stats(None, product_dict)
+        sync_published_catalog(None, product_dict)
+        conflicts = check_locations(None, product_dict)
+        apply_capacity(None, product_dict)
         serialized = _serialize_product(product_dict)
 
         return jsonify({
             "msg": f"{new_codigo} e {data.get('nome_do_produto')} - produto cadastrado com sucesso",
             "product": serialized,
-            "id": serialized["id"]
+            "id": serialized["id"],
+            "conflitos_armazenamento": conflicts,
+            "alertas_capacidade": location_capacity_alerts(product_dict)
         }), 201
 
     except Exception as e:
@@ -188,14 +294,17 @@ def create_product():
 @product_bp.route('/products', methods=['GET'])
 @role_required([ROLES['ADMIN'], ROLES['ANALYST']])
 def list_products():
-    try:
-        status_filter = request.args.get('status')
-        query = {}
-        if status_filter:
-            query['status'] = status_filter
+    projection, fields, error = _parse_fields()
+    if error:
+        return jsonify({"msg": error}), 400
+
+    query, sort, error = build_product_query(request.args)
+    if error:
+        return jsonify({"msg": error}), 400
 
-        cursor = Product.collection().find(query).sort([('_id', -1)])
-        products = [_serialize_product(doc) for doc in cursor]
+    try:
+        cursor = Product.collection().find(Product.active(query), projection).sort(sort)
+        products = [_serialize_fields(doc, fields) for doc in cursor]
 
         return jsonify(products), 200
 
@@ -203,6 +312,161 @@ def list_products():
         return jsonify({"msg": f"Erro ao listar produtos: {str(e)}"}), 500
 
 
+# ============================================================
+# EXPORT (CSV / XLSX)
+# ============================================================
+
+# Colunas simples da exportação (campo do documento -> cabeçalho)
+EXPORT_COLUMNS = (
+    ('codigo', 'codigo'),
+    ('nome_do_produto', 'nome_do_produto'),
+    ('fornecedor', 'fornecedor'),
+    ('empresa', 'empresa'),
+    ('estado_fisico', 'estado_fisico'),
+    ('local_de_armazenamento', 'local_de_armazenamento'),
+    ('qtade_maxima_armazenada', 'qtade_maxima_armazenada'),
+    ('categoria', 'categoria'),
+    ('palavra_de_perigo', 'palavra_de_perigo'),
+    ('status', 'status'),
+)
+EXPORT_HAZARD_FIELDS = ('perigos_fisicos', 'perigos_saude', 'perigos_meio_ambiente')
+EXPORT_SUBSTANCE_FIELDS = ('nome', 'cas', 'concentracao')
+
+# Documentos lidos por vez do cursor (e por consulta de nomes de criadores)
+EXPORT_BATCH_SIZE = 500
+
+# Exportações simultâneas por processo (cada uma mantém um cursor aberto no MongoDB)
+EXPORT_MAX_CONCURRENT = 2
+
+
+def _max_substances(query):
+    result = next(Product.collection().aggregate([
+        {"$match": query},
+        {"$group": {"_id": None, "max": {"$max": {
+            "$cond": [{"$isArray": "$substancias"}, {"$size": "$substancias"}, 0]
+        }}}}
+    ]), None)
+    return result["max"] if result else 0
+
+
+def _export_header(max_substances):
+    header = [title for _, title in EXPORT_COLUMNS]
+    header += ['qtade_normalizada', 'unidade_normalizada']
+    header += list(EXPORT_HAZARD_FIELDS)
+    for n in range(1, max_substances + 1):
+        header += [f"substancia_{n}_{field}" for field in EXPORT_SUBSTANCE_FIELDS]
+    header += ['criado_por', 'created_at', 'updated_at', 'pdf_url']
+    return header
+
+
+def _creator_names(docs, cache):
+    """Resolve, com uma única consulta, os nomes dos criadores ainda não vistos."""
+    missing = set()
+    for doc in docs:
+        user_id = doc.get("created_by_user_id")
+        if user_id and str(user_id) not in cache:
+            missing.add(str(user_id))
+    object_ids = [ObjectId(user_id) for user_id in missing if ObjectId.is_valid(user_id)]
+    if object_ids:
+        for user in User.collection().find({"_id": {"$in": object_ids}}, {"username": 1, "name": 1}):
+            cache[str(user["_id"])] = user.get("username") or user.get("name")
+    for user_id in missing:
+        cache.setdefault(user_id, user_id)
+
+
+def _export_row(doc, max_substances, creators):
+    row = [doc.get(field) for field, _ in EXPORT_COLUMNS]
+    quantity = doc.get("qtade_normalizada") or {}
+    row += [quantity.get("valor"), quantity.get("unidade")]
+    for field in EXPORT_HAZARD_FIELDS:
+        row.append("; ".join(str(h) for h in (doc.get(field) or [])))
+    substancias = doc.get("substancias") if isinstance(doc.get("substancias"), list) else []
+    for n in range(max_substances):
+        substance = substancias[n] if n < len(substancias) and isinstance(substancias[n], dict) else {}
+        row += [substance.get(field) for field in EXPORT_SUBSTANCE_FIELDS]
+    user_id = doc.get("created_by_user_id")
+    row += [
+        creators.get(str(user_id)) if user_id else None,
+        _serialize_dt(doc.get("created_at")),
+        _serialize_dt(doc.get("updated_at")),
+        doc.get("pdf_url"),
+    ]
+    return row
+
+
+def _export_rows(query, sort, max_substances):
+    """Percorre o cursor em lotes, resolvendo os criadores de cada lote de uma vez."""
+    creators = {}
+    cursor = Product.collection().find(query).sort(sort).batch_size(EXPORT_BATCH_SIZE)
+    batch = []
+    for doc in cursor:
+        batch.append(doc)
+        if len(batch) >= EXPORT_BATCH_SIZE:
+            _creator_names(batch, creators)
+            for item in batch:
+                yield _export_row(item, max_substances, creators)
+            batch = []
+    _creator_names(batch, creators)
+    for item in batch:
+        yield _export_row(item, max_substances, creators)
+
+
+def _stream_csv(header, rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    # BOM para o Excel reconhecer o UTF-8
+    buffer.write('\ufeff')
+    writer.writerow(header)
+    for count, row in enumerate(rows, start=1):
+        # Campos digitados pelos usuários: nada pode virar fórmula ao abrir no Excel
+        writer.writerow([csv_safe(value) for value in row])
+        if count % EXPORT_BATCH_SIZE == 0:
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode('utf-8')
+
+
+@product_bp.route('/products/export', methods=['GET'])
+@role_required([ROLES['ADMIN'], ROLES['ANALYST']], max_concurrent=EXPORT_MAX_CONCURRENT)
+def export_products():
+    """
+    Exporta o inventário de produtos em CSV (padrão) ou XLSX via ?format=.
+    Aceita os mesmos filtros e ordenação de GET /products. A planilha é gerada
+    em streaming a partir do cursor, com memória constante.
+    """
+    export_format = (request.args.get('format') or 'csv').lower()
+    if export_format not in ('csv', 'xlsx'):
+        return jsonify({"msg": "Formato inválido. Use: csv ou xlsx."}), 400
+
+    query, sort, error = build_product_query(request.args)
+    if error:
+        return jsonify({"msg": error}), 400
+    query = Product.active(query)
+
+    try:
+        max_substances = _max_substances(query)
+    except Exception as e:
+        return jsonify({"msg": f"Erro ao exportar produtos: {str(e)}"}), 500
+
+    header = _export_header(max_substances)
+    rows = _export_rows(query, sort, max_substances)
+    filename = f"inventario_produtos_{datetime.utcnow():%Y%m%d}.{export_format}"
+
+    if export_format == 'xlsx':
+        body = stream_xlsx(header, rows, sheet_name='Produtos')
+        mimetype = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+    else:
+        body = _stream_csv(header, rows)
+        mimetype = 'text/csv'
+
+    return Response(
+        stream_with_context(body),
+        mimetype=mimetype,
+        headers={'Content-Disposition': f'attachment; filename="{filename}"'}
+    )
+
+
 # ============================================================
 # GET PRODUCT BY ID
 # ============================================================
@@ -214,12 +478,16 @@ def get_product(product_id):
     except Exception:
         return jsonify({"msg": "ID do produto inválido."}), 400
 
+    projection, fields, error = _parse_fields()
+    if error:
+        return jsonify({"msg": error}), 400
+
     try:
-        doc = Product.collection().find_one({"_id": _id})
+        doc = Product.collection().find_one(Product.active({"_id": _id}), projection)
         if not doc:
             return jsonify({"msg": "Produto não encontrado."}), 404
 
-        return jsonify(_serialize_product(doc)), 200
+        return jsonify(_serialize_fields(doc, fields)), 200
 
     except Exception as e:
         return jsonify({"msg": f"Erro ao buscar produto: {str(e)}"}), 500
@@ -241,7 +509,7 @@ def update_product(product_id):
     data = request.get_json() or {}
 
     try:
-        doc = Product.collection().find_one({"_id": _id})
+        doc = Product.collection().find_one(Product.active({"_id": _id}))
         if not doc:
             return jsonify({"msg": "Produto não encontrado."}), 404
 
@@ -274,12 +542,43 @@ def update_product(product_id):
         update_doc = {k: v for k, v in data.items() if k in fields_allowed}
         update_doc["updated_at"] = datetime.utcnow()
 
-        Product.collection().update_one({"_id": _id}, {"$set": update_doc})
+        if 'qtade_maxima_armazenada' in update_doc:
+            update_doc['qtade_normalizada'] = normalize_quantity(update_doc['qtade_maxima_armazenada'])
+
+        # A miniatura pertence ao PDF anterior; a nova é associada por GET /pdfs/<id>/thumbnail
+        if 'pdf_s3_key' in update_doc and update_doc['pdf_s3_key'] != doc.get('pdf_s3_key'):
+            update_doc['thumbnail_s3_key'] = None
+            update_doc['page_count'] = None
+            update_doc['thumbnail_erro'] = None
+
+        # As mesmas condições verificadas acima entram no filtro, e os contadores partem do
+        # documento retornado pela própria atualização: uma mudança de status ou exclusão
+        # concorrente não é contada duas vezes nem perdida
+        update_filter = Product.active({"_id": _id})
+        if role_value == ROLES['ANALYST']:
+            update_filter["created_by_user_id"] = {"$in": [str(current_oid), current_oid]}
+            update_filter["status"] = {"$ne": "aprovado"}
 
-        updated = Product.collection().find_one({"_id": _id})
+        previous = Product.collection().find_one_and_update(
+            update_filter,
+            {"$set": update_doc},
+            return_document=ReturnDocument.BEFORE
+        )
+        if previous is None:
+            if Product.collection().count_documents(Product.active({"_id": _id}), limit=1):
+                return jsonify({"msg": "O produto foi alterado por outra requisição. Tente novamente."}), 409
+            return jsonify({"msg": "Produto não encontrado."}), 404
+
+        updated = dict(previous, **update_doc)
+        apply_product_stats(previous, updated)
+        sync_published_catalog(previous, updated)
+        conflicts = check_locations(previous, updated)
+        apply_capacity(previous, updated)
         return jsonify({
             "msg": "Produto atualizado com sucesso.",
-            "product": _serialize_product(updated)
+            "product": _serialize_product(updated),
+            "conflitos_armazenamento": conflicts,
+            "alertas_capacidade": location_capacity_alerts(updated)
         }), 200
 
     except Exception as e:
@@ -304,14 +603,18 @@ def update_product_status(product_id):
         return jsonify({"msg": "Status inválido. Use: aprovado, rejeitado ou pendente."}), 400
 
     try:
-        result = Product.collection().update_one(
-            {"_id": _id},
-            {"$set": {"status": status, "updated_at": datetime.utcnow()}}
+        now = datetime.utcnow()
+        previous = Product.collection().find_one_and_update(
+            Product.active({"_id": _id}),
+            {"$set": {"status": status, "updated_at": now}},
+            return_document=ReturnDocument.BEFORE
         )
-        if result.matched_count == 0:
+        if previous is None:
             return jsonify({"msg": "Produto não encontrado."}), 404
 
-        updated = Product.collection().find_one({"_id": _id})
+        updated = dict(previous, status=status, updated_at=now)
+        apply_product_stats(previous, updated)
+        sync_published_catalog(previous, updated)
         return jsonify({
             "msg": f"Status atualizado para '{status}' com sucesso.",
             "product": _serialize_product(updated)
@@ -327,15 +630,28 @@ def update_product_status(product_id):
 @product_bp.route('/products/<product_id>', methods=['DELETE'])
 @role_required([ROLES['ADMIN']])
 def delete_product(product_id):
+    """
+    Exclusão lógica: o produto recebe 'deleted_at' e some das consultas.
+    O documento e o PDF no S3 são removidos depois pelo comando 'flask reconcile-pdfs'.
+    """
     try:
         _id = ObjectId(product_id)
     except Exception:
         return jsonify({"msg": "ID do produto inválido."}), 400
 
     try:
-        result = Product.collection().delete_one({"_id": _id})
-        if result.deleted_count == 0:
+        now = datetime.utcnow()
+        deleted = Product.collection().find_one_and_update(
+            Product.active({"_id": _id}),
+            {"$set": {"deleted_at": now, "deleted_by_user_id": str(get_jwt_identity()), "updated_at": now}},
+            return_document=ReturnDocument.BEFORE
+        )
+        if deleted is None:
             return jsonify({"msg": "Produto não encontrado."}), 404
+        apply_product_stats(deleted, None)
+        sync_published_catalog(deleted, None)
+        check_locations(deleted, None)
+        apply_capacity(deleted, None)
         return jsonify({"msg": "Produto excluído com sucesso."}), 200
     except Exception as e:
         return jsonify({"msg": f"Erro ao excluir produto: {str(e)}"}), 500
@@ -0,0 +1,72 @@
+# app/routes/storage_routes.py
+from flask import request, jsonify, Blueprint
+
+from app.models import StorageConflicts
+from app.utils import ROLES, role_required
+from app.compatibility import GHS_CLASSES, INCOMPATIBLE_PAIRS, ensure_storage_compatibility
+from app.capacity import CAPACITY_DIMENSIONS, capacity_alerts, read_capacity
+
+storage_bp = Blueprint('storage', __name__)
+
+
+def _serialize_conflicts(doc):
+    doc = dict(doc)
+    doc.pop("_id", None)
+    if doc.get("atualizado_em"):
+        doc["atualizado_em"] = doc["atualizado_em"].isoformat()
+    return doc
+
+
+# ============================================================
+# COMPATIBILIDADE GHS POR LOCAL
+# ============================================================
+@storage_bp.route('/storage/compatibility', methods=['GET'])
+@role_required([ROLES['ADMIN'], ROLES['ANALYST']])
+def get_storage_compatibility():
+    """
+    Lista os pares de produtos incompatíveis por local de armazenamento.
+    ?local_de_armazenamento= restringe a um local. Os resultados são mantidos
+    pelas rotas de produto, então a leitura não recalcula nada.
+    """
+    try:
+        ensure_storage_compatibility()
+        location = request.args.get('local_de_armazenamento')
+        query = {"_id": location} if location else {}
+        locations = [
+            _serialize_conflicts(doc)
+            for doc in StorageConflicts.collection().find(query).sort([("total_conflitos", -1)])
+        ]
+        return jsonify({
+            "classes": list(GHS_CLASSES),
+            "incompatibilidades": [list(pair) for pair in INCOMPATIBLE_PAIRS],
+            "locais": locations
+        }), 200
+    except Exception as e:
+        return jsonify({"msg": f"Erro ao buscar conflitos de armazenamento: {str(e)}"}), 500
+
+
+# ============================================================
+# CAPACIDADE DE ARMAZENAMENTO
+# ============================================================
+@storage_bp.route('/storage/capacity', methods=['GET'])
+@role_required([ROLES['ADMIN'], ROLES['ANALYST']])
+def get_storage_capacity():
+    """
+    Soma das quantidades máximas armazenadas (em kg e L) agrupadas por
+    ?group_by=local_de_armazenamento (padrão), empresa ou classe_ghs.
+    ?chave= restringe a um local/empresa/classe. Inclui os alertas dos
+    locais que passam do limite configurado.
+    """
+    group_by = request.args.get('group_by', 'local_de_armazenamento')
+    if group_by not in CAPACITY_DIMENSIONS:
+        return jsonify({"msg": f"group_by inválido. Use: {', '.join(CAPACITY_DIMENSIONS)}."}), 400
+
+    try:
+        rows = read_capacity(group_by, request.args.get('chave'))
+        return jsonify({
+            "group_by": group_by,
+            "totais": rows,
+            "alertas": capacity_alerts(rows)
+        }), 200
+    except Exception as e:
+        return jsonify({"msg": f"Erro ao buscar capacidade de armazenamento: {str(e)}"}), 500
@@ -4,6 +4,12 @@ from flask import request, jsonify, Blueprint
 from flask_jwt_extended import create_access_token
 from werkzeug.security import generate_password_hash, check_password_hash
 from bson.objectid import ObjectId
+from pymongo.errors import BulkWriteError
+from concurrent.futures import ThreadPoolExecutor
+import csv
+import io
+import json
+import os
 
 # Importa a classe User do módulo models
 from app.models import User
@@ -13,6 +19,17 @@ from app.utils import ROLES, role_required
 # Cria um Blueprint para as rotas de usuário
 user_bp = Blueprint('user', __name__)
 
+# Cadastro em lote: quantidade de linhas por lote (uma consulta $in e um insert_many por lote)
+BULK_BATCH_SIZE = int(os.environ.get('USERS_BULK_BATCH_SIZE', 500))
+# Threads usadas para gerar os hashes de senha em paralelo (o hashlib libera o GIL)
+BULK_HASH_WORKERS = int(os.environ.get('USERS_BULK_HASH_WORKERS', 4))
+
+# Campos aceitos em cada linha do CSV/JSONL (mesmos nomes usados em /register)
+BULK_USER_FIELDS = (
+    'nome_do_usuario', 'email', 'senha', 'nivel',
+    'cpf', 'empresa', 'setor', 'data_de_nascimento', 'planta'
+)
+
 # Rota de registro de usuário
 @user_bp.route('/register', methods=['POST'])
 def register():
@@ -44,7 +61,7 @@ def register():
         return jsonify({"msg": "Nome de usuário, email e senha são obrigatórios"}), 400
 
     # Verifica se o nome de usuário já existe
-    if User.collection().find_one({"nome_do_usuario": nome_do_usuario}): # ATUALIZADO: Busca por 'nome_do_usuario'
+    if User.collection().find_one({"username": nome_do_usuario}): # O documento armazena o campo como 'username'
         return jsonify({"msg": "Nome de usuário já existe"}), 409
     
     # Verifica se o email já existe
@@ -113,8 +130,9 @@ def login():
     # Converte o dicionário do MongoDB para um objeto User
     user = User.from_dict(user_data)
 
-    # Cria um token de acesso JWT com a identidade do usuário (ID do MongoDB)
-    access_token = create_access_token(identity=str(user._id))
+    # Cria um token de acesso JWT com a identidade do usuário (ID do MongoDB);
+    # o claim 'role' só escolhe o limite de taxa (app/ratelimit.py), a permissão é verificada no banco
+    access_token = create_access_token(identity=str(user._id), additional_claims={"role": user.role})
     return jsonify(access_token=access_token, user={'id': str(user._id), 'username': user.username, 'email': user.email, 'role': user.role}), 200
 
 # --- Rotas CRUD para Usuários (Administrador) ---
@@ -144,6 +162,204 @@ def get_users():
         })
     return jsonify(users_list), 200
 
+# ============================================================
+# CADASTRO EM LOTE (CSV / JSONL)
+# ============================================================
+
+def _iter_bulk_rows():
+    """
+    Lê as linhas enviadas para /users/bulk sem carregar o arquivo inteiro.
+    Aceita um arquivo no campo 'file' (multipart) ou o corpo bruto da requisição.
+    O formato é definido pela extensão do arquivo ou pelo Content-Type (CSV ou JSONL).
+    Gera tuplas (numero_da_linha, dados, erro).
+    """
+    if 'file' in request.files:
+        upload = request.files['file']
+        stream = upload.stream
+        is_jsonl = (upload.filename or '').lower().endswith(('.jsonl', '.ndjson'))
+    else:
+        stream = request.stream
+        content_type = (request.mimetype or '').lower()
+        is_jsonl = content_type in ('application/jsonl', 'application/x-ndjson', 'application/x-jsonlines')
+
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+
+    if is_jsonl:
+        for line_number, line in enumerate(text, start=1):
+            if not line.strip():
+                continue
+            try:
+                data = json.loads(line)
+            except ValueError:
+                yield line_number, None, "JSON inválido"
+                continue
+            if not isinstance(data, dict):
+                yield line_number, None, "Cada linha deve ser um objeto JSON"
+                continue
+            yield line_number, data, None
+    else:
+        reader = csv.DictReader(text)
+        for data in reader:
+            # line_num considera o cabeçalho, igual à numeração vista numa planilha
+            yield reader.line_num, data, None
+
+
+def _bulk_batches(rows):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= BULK_BATCH_SIZE:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _process_bulk_batch(batch, seen_usernames, seen_emails, executor):
+    """
+    Processa um lote de linhas: valida, verifica duplicados com uma única consulta $in,
+    gera os hashes em paralelo e insere tudo com insert_many(ordered=False).
+    Retorna a lista de resultados por linha.
+    """
+    results = {}
+    candidates = []
+
+    for line_number, data, error in batch:
+        if error:
+            results[line_number] = {"linha": line_number, "status": "erro", "msg": error}
+            continue
+
+        row = {field: (data.get(field) or None) for field in BULK_USER_FIELDS}
+        # JSONL aceita qualquer tipo: números, listas ou objetos quebrariam o hash e os conjuntos abaixo
+        non_text = [field for field, value in row.items() if value is not None and not isinstance(value, str)]
+        if non_text:
+            results[line_number] = {"linha": line_number, "status": "erro",
+                                    "msg": f"Campos devem ser texto: {', '.join(non_text)}"}
+            continue
+        for field, value in row.items():
+            if isinstance(value, str):
+                row[field] = value.strip() or None
+        row['nivel'] = row['nivel'] or ROLES['VIEWER']
+
+        if not row['nome_do_usuario'] or not row['email'] or not row['senha']:
+            msg = "Nome de usuário, email e senha são obrigatórios"
+        elif row['nivel'] not in ROLES.values():
+            msg = "Role inválido"
+        elif row['nome_do_usuario'] in seen_usernames:
+            msg = "Nome de usuário repetido no arquivo"
+        elif row['email'] in seen_emails:
+            msg = "Email repetido no arquivo"
+        else:
+            msg = None
+
+        if msg:
+            results[line_number] = {"linha": line_number, "status": "erro", "msg": msg}
+            continue
+
+        seen_usernames.add(row['nome_do_usuario'])
+        seen_emails.add(row['email'])
+        candidates.append((line_number, row))
+
+    if candidates:
+        # Uma única consulta por lote para os duplicados já existentes no banco
+        existing = User.collection().find(
+            {"$or": [
+                {"username": {"$in": [row['nome_do_usuario'] for _, row in candidates]}},
+                {"email": {"$in": [row['email'] for _, row in candidates]}}
+            ]},
+            {"username": 1, "email": 1}
+        )
+        existing_usernames = set()
+        existing_emails = set()
+        for user_data in existing:
+            existing_usernames.add(user_data.get('username'))
+            existing_emails.add(user_data.get('email'))
+
+        to_insert = []
+        for line_number, row in candidates:
+            if row['nome_do_usuario'] in existing_usernames:
+                results[line_number] = {"linha": line_number, "status": "erro", "msg": "Nome de usuário já existe"}
+            elif row['email'] in existing_emails:
+                results[line_number] = {"linha": line_number, "status": "erro", "msg": "Email já está em uso"}
+            else:
+                to_insert.append((line_number, row))
+
+        # Hash das senhas em paralelo (é a parte mais cara do cadastro)
+        hashes = list(executor.map(generate_password_hash, [row['senha'] for _, row in to_insert]))
+
+        documents = []
+        for (line_number, row), password_hash in zip(to_insert, hashes):
+            new_user = User(
+                username=row['nome_do_usuario'],
+                email=row['email'],
+                password_hash=password_hash,
+                role=row['nivel'],
+                cpf=row['cpf'],
+                empresa=row['empresa'],
+                setor=row['setor'],
+                data_de_nascimento=row['data_de_nascimento'],
+                planta=row['planta']
+            )
+            documents.append(new_user.to_dict())
+
+        if documents:
+            failed = {}
+            try:
+                User.collection().insert_many(documents, ordered=False)
+            except BulkWriteError as e:
+                # Os índices únicos pegam duplicados criados por requisições concorrentes
+                for write_error in e.details.get('writeErrors', []):
+                    if write_error.get('code') == 11000:
+                        failed[write_error['index']] = "Nome de usuário ou email já existe"
+                    else:
+                        failed[write_error['index']] = write_error.get('errmsg', "Erro ao inserir usuário")
+
+            for index, ((line_number, row), document) in enumerate(zip(to_insert, documents)):
+                if index in failed:
+                    results[line_number] = {"linha": line_number, "status": "erro", "msg": failed[index]}
+                else:
+                    results[line_number] = {
+                        "linha": line_number,
+                        "status": "criado",
+                        "id": str(document['_id']),
+                        "nome_do_usuario": row['nome_do_usuario'],
+                        "email": row['email']
+                    }
+
+    return [results[line_number] for line_number in sorted(results)]
+
+
+@user_bp.route('/users/bulk', methods=['POST'])
+@role_required([ROLES['ADMIN']], max_concurrent=1)
+def bulk_register_users():
+    """
+    Cadastra vários usuários de uma vez a partir de um arquivo CSV ou JSONL.
+    Apenas para administradores. Cada linha usa os mesmos campos de /register
+    ('nome_do_usuario', 'email', 'senha', 'nivel', 'cpf', 'empresa', 'setor',
+    'data_de_nascimento', 'planta') e recebe um resultado individual na resposta.
+    """
+    results = []
+    seen_usernames = set()
+    seen_emails = set()
+
+    try:
+        with ThreadPoolExecutor(max_workers=BULK_HASH_WORKERS) as executor:
+            for batch in _bulk_batches(_iter_bulk_rows()):
+                results.extend(_process_bulk_batch(batch, seen_usernames, seen_emails, executor))
+    except (UnicodeDecodeError, csv.Error) as e:
+        return jsonify({"msg": f"Arquivo inválido: {str(e)}"}), 400
+
+    if not results:
+        return jsonify({"msg": "Nenhuma linha enviada"}), 400
+
+    created = sum(1 for r in results if r['status'] == 'criado')
+    return jsonify({
+        "msg": f"{created} de {len(results)} usuários cadastrados",
+        "criados": created,
+        "erros": len(results) - created,
+        "resultados": results
+    }), 200
+
 # Update User (sem alterações necessárias aqui para este problema, mas se 'planta' e outros campos
 # também pudessem ser atualizados, eles precisariam ser adicionados aqui)
 @user_bp.route('/users/<user_id>', methods=['PUT'])
@@ -0,0 +1,115 @@
+# app/startup_benchmark.py
+"""
+Mede o tempo de inicialização da aplicação e falha se passar do orçamento.
+
+    python -m app.startup_benchmark          (a partir da raiz do projeto)
+
+Executa, em um processo Python novo:
+    1. 'python -X importtime' de create_app() e lista as importações mais lentas;
+    2. o tempo até a primeira resposta de GET / (início do processo até a resposta).
+Também verifica que o boto3 não é importado e que o MongoDB não é acessado
+antes de uma rota precisar deles. Retorna código 1 se algum limite for violado,
+para uso no CI.
+
+Orçamentos (ms), configuráveis por variável de ambiente:
+    STARTUP_IMPORT_BUDGET_MS         (padrão 1500) importações até create_app()
+    STARTUP_FIRST_REQUEST_BUDGET_MS  (padrão 2500) até a primeira resposta
+"""
+import os
+import subprocess
+import sys
+import time
+
+IMPORT_BUDGET_MS = int(os.environ.get('STARTUP_IMPORT_BUDGET_MS', 1500))
+FIRST_REQUEST_BUDGET_MS = int(os.environ.get('STARTUP_FIRST_REQUEST_BUDGET_MS', 2500))
+
+# Módulos que não podem ser carregados só para subir a aplicação
+LAZY_MODULES = ('boto3', 'botocore', 'fitz')
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_FIRST_REQUEST_SCRIPT = """
+import sys
+from app import create_app
+import app as app_package
+flask_app = create_app()
+response = flask_app.test_client().get('/')
+assert response.status_code == 200, response.status_code
+loaded = [name for name in {lazy!r} if name in sys.modules]
+print('LAZY_LOADED=' + ','.join(loaded))
+print('DB_CONNECTED=' + str(app_package.db is not None))
+"""
+
+
+def _run(args, env=None):
+    return subprocess.run(
+        [sys.executable] + args,
+        cwd=PROJECT_ROOT,
+        capture_output=True,
+        text=True,
+        env=env
+    )
+
+
+def measure_imports():
+    """Retorna (tempo_total_ms, [(tempo_ms, modulo), ...]) a partir de -X importtime."""
+    result = _run(['-X', 'importtime', '-c', 'from app import create_app; create_app()'])
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr)
+
+    timings = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative_us, module = line.split('|')
+        # O nome vem indentado conforme o aninhamento; só o nível mais alto entra no total
+        top_level = not module[1:].startswith(' ')
+        timings.append((int(cumulative_us) / 1000, module.strip(), top_level))
+
+    total_ms = sum(ms for ms, _, top_level in timings if top_level)
+    slowest = sorted(((ms, module) for ms, module, _ in timings), reverse=True)[:15]
+    return total_ms, slowest
+
+
+def measure_first_request():
+    """Retorna (tempo_ms, modulos_pesados_carregados, mongo_conectado)."""
+    script = _FIRST_REQUEST_SCRIPT.format(lazy=LAZY_MODULES)
+    start = time.perf_counter()
+    result = _run(['-c', script])
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr)
+
+    output = dict(line.split('=', 1) for line in result.stdout.splitlines() if '=' in line)
+    lazy_loaded = [name for name in output.get('LAZY_LOADED', '').split(',') if name]
+    return elapsed_ms, lazy_loaded, output.get('DB_CONNECTED') == 'True'
+
+
+def main():
+    failures = []
+
+    import_ms, slowest = measure_imports()
+    print(f"Importações até create_app(): {import_ms:.0f} ms (orçamento {IMPORT_BUDGET_MS} ms)")
+    for ms, module in slowest:
+        print(f"    {ms:8.1f} ms  {module}")
+    if import_ms > IMPORT_BUDGET_MS:
+        failures.append(f"importações levaram {import_ms:.0f} ms")
+
+    first_request_ms, lazy_loaded, db_connected = measure_first_request()
+    print(f"Até a primeira resposta: {first_request_ms:.0f} ms (orçamento {FIRST_REQUEST_BUDGET_MS} ms)")
+    if first_request_ms > FIRST_REQUEST_BUDGET_MS:
+        failures.append(f"primeira resposta levou {first_request_ms:.0f} ms")
+    if lazy_loaded:
+        failures.append(f"módulos carregados na inicialização: {', '.join(lazy_loaded)}")
+    if db_connected:
+        failures.append("o MongoDB foi acessado durante a inicialização")
+
+    if failures:
+        print("FALHOU: " + "; ".join(failures))
+        return 1
+    print("OK")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
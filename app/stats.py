@@ -0,0 +1,123 @@
+# app/stats.py
+"""
+Contadores incrementais do catálogo de produtos.
+
+As rotas de produto chamam apply_product_stats() com o documento antes e depois
+de cada escrita, e o documento de contadores é atualizado com um único $inc.
+Assim GET /products/stats lê um só documento, qualquer que seja o tamanho do catálogo.
+rebuild_product_stats() recalcula tudo com $facet para corrigir divergências; a primeira
+leitura após a implantação (documento ausente ou nunca recalculado) o executa automaticamente.
+"""
+import logging
+from datetime import datetime
+
+from app.models import Product, ProductStats
+
+# Campos do produto que têm contagem por valor
+STATS_DIMENSIONS = ('status', 'empresa', 'categoria', 'palavra_de_perigo')
+
+# Chave usada quando o produto não tem valor para o campo
+EMPTY_KEY = 'nao_informado'
+
+
+def _counter_key(value):
+    """
+    Converte o valor de um campo em uma chave válida para o caminho do $inc
+    ('.' e '$' inicial não são permitidos em nomes de campo do MongoDB).
+    """
+    if value is None or value == '':
+        return EMPTY_KEY
+    key = str(value).replace('.', '．')
+    if key.startswith('$'):
+        key = '＄' + key[1:]
+    return key
+
+
+def _decode_key(key):
+    return key.replace('．', '.').replace('＄', '$')
+
+
+def _doc_counters(doc, sign):
+    counters = {'total': sign}
+    for dimension in STATS_DIMENSIONS:
+        counters[f"{dimension}.{_counter_key(doc.get(dimension))}"] = sign
+    return counters
+
+
+def product_stats_delta(old_doc, new_doc):
+    """
+    Calcula o $inc que leva os contadores do estado old_doc para new_doc.
+    Use None para indicar criação (old_doc) ou exclusão (new_doc).
+    """
+    delta = {}
+    old_doc = old_doc if old_doc and old_doc.get('deleted_at') is None else None
+    new_doc = new_doc if new_doc and new_doc.get('deleted_at') is None else None
+    for doc, sign in ((old_doc, -1), (new_doc, 1)):
+        if not doc:
+            continue
+        for path, value in _doc_counters(doc, sign).items():
+            delta[path] = delta.get(path, 0) + value
+    return {path: value for path, value in delta.items() if value}
+
+
+def apply_product_stats(old_doc, new_doc):
+    """
+    Aplica a variação dos contadores de forma atômica ($inc com upsert).
+    Falhas são apenas registradas: o produto já foi gravado e o comando
+    'flask rebuild-product-stats' corrige qualquer divergência.
+    """
+    delta = product_stats_delta(old_doc, new_doc)
+    if not delta:
+        return
+    try:
+        ProductStats.collection().update_one(
+            {"_id": ProductStats.document_id},
+            {"$inc": delta},
+            upsert=True
+        )
+    except Exception:
+        logging.exception("Erro ao atualizar os contadores de produtos.")
+
+
+def read_product_stats():
+    """Lê o documento de contadores e devolve as contagens por campo."""
+    doc = ProductStats.collection().find_one({"_id": ProductStats.document_id})
+    if not doc or "recalculado_em" not in doc:
+        # Sem recálculo inicial os contadores só refletiriam as escritas feitas após a implantação
+        return rebuild_product_stats()
+    stats = {"total": doc.get("total", 0)}
+    for dimension in STATS_DIMENSIONS:
+        stats[dimension] = {
+            _decode_key(key): count
+            for key, count in (doc.get(dimension) or {}).items()
+            if count
+        }
+    return stats
+
+
+def rebuild_product_stats():
+    """
+    Recalcula todos os contadores com uma única agregação $facet e substitui
+    o documento de contadores. Retorna as contagens recalculadas.
+    """
+    facets = {"total": [{"$count": "n"}]}
+    for dimension in STATS_DIMENSIONS:
+        facets[dimension] = [{"$group": {"_id": f"${dimension}", "n": {"$sum": 1}}}]
+
+    result = next(Product.collection().aggregate([
+        {"$match": Product.active()},
+        {"$facet": facets}
+    ]), {})
+
+    doc = {"_id": ProductStats.document_id, "recalculado_em": datetime.utcnow()}
+    total = result.get("total") or []
+    doc["total"] = total[0]["n"] if total else 0
+    for dimension in STATS_DIMENSIONS:
+        counts = {}
+        for group in result.get(dimension, []):
+            key = _counter_key(group["_id"])
+            counts[key] = counts.get(key, 0) + group["n"]
+        doc[dimension] = counts
+
+    ProductStats.collection().replace_one({"_id": ProductStats.document_id}, doc, upsert=True)
+    return read_product_stats()
@@ -0,0 +1,87 @@
+# app/storage.py
+"""
+Acesso preguiçoso (lazy) ao AWS S3 e à coleção de metadados de PDF.
+
+Nada é criado na importação: o boto3 só é importado e o cliente S3 só é
+construído na primeira chamada de get_s3_client(), protegida por lock para
+que threads simultâneas criem um único cliente (o cliente boto3 é thread-safe).
+"""
+import logging
+import os
+import threading
+from urllib.parse import unquote, urlparse
+
+_s3_client = None
+_s3_lock = threading.Lock()
+
+
+def get_s3_bucket_name():
+    return os.getenv('S3_BUCKET_NAME')
+
+
+def get_aws_region():
+    return os.getenv('AWS_REGION')
+
+
+def get_s3_client():
+    """Retorna o cliente S3, criando-o no primeiro uso. Retorna None se a criação falhar."""
+    global _s3_client
+    if _s3_client is None:
+        with _s3_lock:
+            if _s3_client is None:
+                try:
+                    import boto3  # Importação pesada: adiada até o primeiro uso do S3
+
+                    _s3_client = boto3.client(
+                        's3',
+                        aws_access_key_id=os.getenv('AWS_ACCESS_KEY_ID'),
+                        aws_secret_access_key=os.getenv('AWS_SECRET_ACCESS_KEY'),
+                        region_name=get_aws_region()
+                    )
+                    logging.info("Cliente AWS S3 inicializado com sucesso.")
+                except Exception as e:
+                    logging.error(f"Erro ao inicializar o cliente AWS S3: {e}")
+    return _s3_client
+
+
+def get_pdf_metadata_collection():
+    """
+    Coleção de metadados dos uploads (MONGO_COLLECTION_NAME), no mesmo banco e
+    com o mesmo cliente MongoDB do restante da aplicação. Retorna None se não configurada.
+    """
+    collection_name = os.getenv('MONGO_COLLECTION_NAME')
+    if not collection_name:
+        return None
+    from app import get_db
+    return get_db()[collection_name]
+
+
+def s3_key_from_url(url, bucket):
+    """
+    Extrai a chave S3 de uma URL do bucket (virtual-hosted ou path-style), como as
+    gravadas em 'pdf_url'. Retorna None se a URL não aponta para o bucket informado.
+    """
+    if not url or not bucket:
+        return None
+    parsed = urlparse(url)
+    host = (parsed.hostname or '').lower()
+    path = unquote(parsed.path or '').lstrip('/')
+    if not host.endswith('amazonaws.com'):
+        return None
+    if host.startswith(f"{bucket.lower()}.s3"):
+        key = path
+    elif host.startswith('s3') and path.startswith(f"{bucket}/"):
+        key = path[len(bucket) + 1:]
+    else:
+        return None
+    return key or None
+
+
+def product_pdf_key(product, bucket):
+    """
+    Chave S3 do PDF de um produto: 'pdf_s3_key' ou, para produtos gravados só com
+    'pdf_url', a chave extraída da URL. None se o PDF não está no bucket.
+    """
+    if not product:
+        return None
+    return product.get("pdf_s3_key") or s3_key_from_url(product.get("pdf_url"), bucket)
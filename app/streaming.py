@@ -0,0 +1,172 @@
+# app/streaming.py
+"""
+Geradores para respostas em streaming: ZIP (e, sobre ele, XLSX) escritos
+entrada por entrada, sem arquivos temporários e sem montar o arquivo em memória.
+
+O zipfile da biblioteca padrão aceita saídas não posicionáveis (usa data
+descriptors), então basta um buffer que entrega os bytes a cada escrita.
+"""
+import io
+import itertools
+import re
+import time
+import zipfile
+from xml.sax.saxutils import escape
+
+
+class _StreamBuffer(io.RawIOBase):
+    """Saída do zipfile: acumula os bytes escritos até o gerador recolhê-los."""
+
+    def __init__(self):
+        super().__init__()
+        self._chunks = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        # O zipfile usa tell() para os offsets do diretório central
+        return self._position
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+# Início de célula que o Excel interpreta como fórmula ao abrir um CSV
+_FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+
+def csv_safe(value):
+    """
+    Neutraliza textos que o Excel executaria como fórmula (ex.: '=HYPERLINK(...)')
+    prefixando-os com apóstrofo. Números e demais valores não são alterados.
+    """
+    if isinstance(value, str) and value.startswith(_FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+def stream_zip(entries):
+    """
+    Gera os bytes de um ZIP a partir de tuplas (nome, blocos, comprimir),
+    onde 'blocos' é um iterável de bytes. Cada entrada é escrita (e entregue
+    ao cliente) assim que seus blocos são produzidos.
+    """
+    buffer = _StreamBuffer()
+    with zipfile.ZipFile(buffer, mode='w', allowZip64=True) as archive:
+        for name, chunks, compress in entries:
+            info = zipfile.ZipInfo(name, date_time=time.localtime()[:6])
+            info.compress_type = zipfile.ZIP_DEFLATED if compress else zipfile.ZIP_STORED
+            with archive.open(info, mode='w', force_zip64=True) as entry:
+                for chunk in chunks:
+                    entry.write(chunk)
+                    data = buffer.drain()
+                    if data:
+                        yield data
+            data = buffer.drain()
+            if data:
+                yield data
+    yield buffer.drain()
+
+
+# ------------------------------------------------------------
+# XLSX (planilha única, células como texto inline ou número)
+# ------------------------------------------------------------
+
+_INVALID_XML_CHARS = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+_CONTENT_TYPES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/xl/workbook.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+    '<Override PartName="/xl/worksheets/sheet1.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+    '</Types>'
+)
+
+_ROOT_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+    'Target="xl/workbook.xml"/>'
+    '</Relationships>'
+)
+
+_WORKBOOK_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+    'Target="worksheets/sheet1.xml"/>'
+    '</Relationships>'
+)
+
+_WORKBOOK = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+    'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+    '<sheets><sheet name="{name}" sheetId="1" r:id="rId1"/></sheets>'
+    '</workbook>'
+)
+
+
+def _column_letter(index):
+    letters = ''
+    index += 1
+    while index:
+        index, remainder = divmod(index - 1, 26)
+        letters = chr(65 + remainder) + letters
+    return letters
+
+
+def _xlsx_cell(ref, value):
+    if value is None or value == '':
+        return ''
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return f'<c r="{ref}"><v>{value}</v></c>'
+    # Texto inline (t="inlineStr") nunca é avaliado como fórmula, mesmo começando com '='
+    text = escape(_INVALID_XML_CHARS.sub('', str(value)))
+    return f'<c r="{ref}" t="inlineStr"><is><t xml:space="preserve">{text}</t></is></c>'
+
+
+def _xlsx_sheet(header, rows, rows_per_chunk):
+    columns = [_column_letter(i) for i in range(len(header))]
+    yield (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+    ).encode('utf-8')
+
+    parts = []
+    for row_number, row in enumerate(itertools.chain([header], rows), start=1):
+        cells = ''.join(_xlsx_cell(f"{columns[i]}{row_number}", value) for i, value in enumerate(row))
+        parts.append(f'<row r="{row_number}">{cells}</row>')
+        if len(parts) >= rows_per_chunk:
+            yield ''.join(parts).encode('utf-8')
+            parts = []
+
+    parts.append('</sheetData></worksheet>')
+    yield ''.join(parts).encode('utf-8')
+
+
+def stream_xlsx(header, rows, sheet_name='Planilha1', rows_per_chunk=500):
+    """Gera um arquivo XLSX de uma planilha a partir do cabeçalho e de um iterável de linhas."""
+    entries = [
+        ('[Content_Types].xml', [_CONTENT_TYPES.encode('utf-8')], True),
+        ('_rels/.rels', [_ROOT_RELS.encode('utf-8')], True),
+        ('xl/workbook.xml', [_WORKBOOK.format(name=escape(sheet_name)).encode('utf-8')], True),
+        ('xl/_rels/workbook.xml.rels', [_WORKBOOK_RELS.encode('utf-8')], True),
+        ('xl/worksheets/sheet1.xml', _xlsx_sheet(header, rows, rows_per_chunk), True),
+    ]
+    return stream_zip(entries)
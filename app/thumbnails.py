@@ -0,0 +1,125 @@
+# app/thumbnails.py
+"""
+Miniaturas da primeira página dos PDFs (FDS).
+
+Após o upload, o PDF é renderizado em segundo plano: a miniatura PNG é gravada
+no S3 em uma chave derivada da original ('uploads/x.pdf' -> 'thumbnails/x.png')
+e o número de páginas fica nos metadados do objeto, no documento de metadados do
+upload e nos produtos que usam o PDF. A renderização usa PyMuPDF (import 'fitz').
+
+Se o PDF não puder ser renderizado (corrompido, sem páginas), o erro fica em
+'thumbnail_erro' nos mesmos documentos e a geração não é agendada de novo.
+"""
+import logging
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from app.models import Product
+
+THUMBNAIL_PREFIX = 'thumbnails/'
+
+# Largura da miniatura em pixels
+THUMBNAIL_WIDTH = int(os.environ.get('THUMBNAIL_WIDTH', 240))
+THUMBNAIL_WORKERS = int(os.environ.get('THUMBNAIL_WORKERS', 2))
+
+# A chave da miniatura deriva da chave do PDF (única por upload), então o conteúdo nunca muda
+THUMBNAIL_CACHE_CONTROL = 'private, max-age=31536000, immutable'
+
+_executor = ThreadPoolExecutor(max_workers=THUMBNAIL_WORKERS, thread_name_prefix='thumbnails')
+_in_progress = set()
+_lock = threading.Lock()
+
+
+def thumbnail_key(pdf_key):
+    """'uploads/<uuid>.pdf' -> 'thumbnails/<uuid>.png'"""
+    name = os.path.splitext(os.path.basename(pdf_key))[0]
+    return f"{THUMBNAIL_PREFIX}{name}.png"
+
+
+def render_first_page(pdf_bytes):
+    """Renderiza a primeira página como PNG. Retorna (png_bytes, numero_de_paginas)."""
+    import fitz  # PyMuPDF, importado só quando há algo para renderizar
+
+    with fitz.open(stream=pdf_bytes, filetype='pdf') as document:
+        page_count = document.page_count
+        page = document.load_page(0)
+        zoom = THUMBNAIL_WIDTH / page.rect.width
+        pixmap = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), alpha=False)
+        return pixmap.tobytes('png'), page_count
+
+
+def _products_using(pdf_key):
+    # Produtos gravados só com 'pdf_url' também usam o PDF
+    return Product.active({"$or": [
+        {"pdf_s3_key": pdf_key},
+        {"pdf_url": {"$regex": re.escape(f"/{pdf_key}") + "$"}}
+    ]})
+
+
+def _record_failure(pdf_key, metadata_collection, error):
+    fields = {"thumbnail_erro": str(error) or error.__class__.__name__}
+    if metadata_collection is not None:
+        metadata_collection.update_many({"s3_file_key": pdf_key}, {"$set": fields})
+    Product.collection().update_many(_products_using(pdf_key), {"$set": fields})
+
+
+def recorded_thumbnail_failure(pdf_key, metadata_collection):
+    """Erro de renderização registrado no upload do PDF, ou None."""
+    if metadata_collection is None:
+        return None
+    doc = metadata_collection.find_one(
+        {"s3_file_key": pdf_key, "thumbnail_erro": {"$ne": None}}, {"thumbnail_erro": 1}
+    )
+    return doc.get("thumbnail_erro") if doc else None
+
+
+def _render_and_store(s3_client, bucket, pdf_key, metadata_collection):
+    try:
+        pdf_bytes = s3_client.get_object(Bucket=bucket, Key=pdf_key)['Body'].read()
+        try:
+            png_bytes, page_count = render_first_page(pdf_bytes)
+        except ImportError:
+            raise
+        except Exception as e:
+            # Falha do próprio PDF: tentar de novo daria o mesmo resultado
+            logging.warning(f"PDF {pdf_key} não pôde ser renderizado: {e}")
+            _record_failure(pdf_key, metadata_collection, e)
+            return
+
+        thumb_key = thumbnail_key(pdf_key)
+        s3_client.put_object(
+            Bucket=bucket,
+            Key=thumb_key,
+            Body=png_bytes,
+            ContentType='image/png',
+            CacheControl=THUMBNAIL_CACHE_CONTROL,
+            Metadata={'page-count': str(page_count)}
+        )
+
+        fields = {"thumbnail_s3_key": thumb_key, "page_count": page_count}
+        if metadata_collection is not None:
+            metadata_collection.update_many({"s3_file_key": pdf_key}, {"$set": fields})
+        Product.collection().update_many(_products_using(pdf_key), {"$set": fields})
+
+        logging.info(f"Miniatura gerada para {pdf_key}: {thumb_key} ({page_count} páginas).")
+    except ImportError:
+        logging.warning("PyMuPDF não está instalado; miniaturas de PDF desativadas.")
+    except Exception:
+        logging.exception(f"Erro ao gerar a miniatura de {pdf_key}.")
+    finally:
+        with _lock:
+            _in_progress.discard(pdf_key)
+
+
+def schedule_thumbnail(s3_client, bucket, pdf_key, metadata_collection=None):
+    """Agenda a renderização da miniatura (ignora PDFs que já estão na fila)."""
+    if not pdf_key or not pdf_key.lower().endswith('.pdf'):
+        return False
+    with _lock:
+        if pdf_key in _in_progress:
+            return True
+        _in_progress.add(pdf_key)
+    _executor.submit(_render_and_store, s3_client, bucket, pdf_key, metadata_collection)
+    return True
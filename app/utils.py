@@ -1,12 +1,15 @@
 # app/utils.py
 
-from flask import jsonify
-from flask_jwt_extended import jwt_required, get_jwt_identity
+from flask import jsonify, request, make_response
+from flask_jwt_extended import jwt_required, get_jwt, get_jwt_identity
 from bson.objectid import ObjectId
+from pymongo.errors import DuplicateKeyError
+from datetime import datetime, timedelta
 import functools
+import hashlib
 
 # Importa a classe User do módulo models (certifique-se que app/models.py está correto)
-from app.models import User
+from app.models import User, IdempotencyKey
 
 # Define os papéis (roles) disponíveis na aplicação
 ROLES = {
@@ -15,15 +18,29 @@ ROLES = {
     'VIEWER': 'visualizador'
 }
 
-def role_required(required_roles):
+def role_required(required_roles, max_concurrent=None, locations=None):
     """
     Decorador para verificar se o usuário autenticado tem um dos papéis necessários.
+    'locations' restringe onde o JWT é procurado (padrão: JWT_TOKEN_LOCATION, só cabeçalhos).
+    Também aplica o controle de admissão (app/ratelimit.py): limite de taxa por usuário
+    e rota conforme o papel, e até 'max_concurrent' execuções simultâneas da rota.
+    Requisições recusadas recebem 429 com Retry-After.
     """
     def decorator(fn):
         @functools.wraps(fn)
-        @jwt_required()
+        @jwt_required(locations=locations)
         def wrapper(*args, **kwargs):
+            from app.ratelimit import acquire_slot, check_rate_limit, retry_after_header
+
             current_user_id = get_jwt_identity()
+
+            # Limite de taxa antes de consultar o MongoDB: requisições recusadas não custam nenhuma consulta.
+            # O papel do claim só escolhe o limite; a autorização abaixo usa o papel gravado no banco.
+            endpoint = request.endpoint or fn.__name__
+            wait = check_rate_limit(current_user_id, get_jwt().get('role'), endpoint)
+            if wait:
+                return (jsonify({"msg": "Muitas requisições. Tente novamente em instantes."}), 429,
+                        {"Retry-After": retry_after_header(wait)})
             
             # Busca os dados do usuário no MongoDB usando a classe User
             user_data = User.collection().find_one({"_id": ObjectId(current_user_id)})
@@ -36,7 +53,111 @@ def role_required(required_roles):
             # Verifica se o papel do usuário está entre os papéis requeridos
             if user.role not in required_roles:
                 return jsonify({"msg": "Acesso negado: Nível de permissão insuficiente"}), 403
-            return fn(*args, **kwargs)
+
+            release = acquire_slot(endpoint, max_concurrent)
+            if release is None:
+                return (jsonify({"msg": "Rota ocupada no momento. Tente novamente em instantes."}), 429,
+                        {"Retry-After": "1"})
+
+            try:
+                response = make_response(fn(*args, **kwargs))
+            except Exception:
+                release()
+                raise
+            # Respostas em streaming (exportação, ZIP, SSE) mantêm a vaga até terminarem de ser enviadas
+            response.call_on_close(release)
+            return response
         return wrapper
     return decorator
 
+
+
+def _request_fingerprint():
+    """Hash do conteúdo da requisição, para recusar a mesma chave com outro corpo."""
+    digest = hashlib.sha256()
+    if request.files:
+        for field, file in sorted(request.files.items(multi=True), key=lambda item: item[0]):
+            digest.update(f"{field}:{file.filename}".encode('utf-8'))
+            for chunk in iter(lambda: file.stream.read(64 * 1024), b''):
+                digest.update(chunk)
+            file.stream.seek(0)
+        for field, value in sorted(request.form.items(multi=True)):
+            digest.update(f"{field}={value}".encode('utf-8'))
+    else:
+        digest.update(request.get_data(cache=True))
+    return digest.hexdigest()
+
+
+def idempotent(fn):
+    """
+    Decorador para rotas de criação que aceitam o cabeçalho Idempotency-Key.
+    A primeira resposta (status < 500) fica gravada; repetições com a mesma chave
+    recebem a resposta gravada sem executar a rota de novo. Deve ficar abaixo de
+    @role_required, pois a chave é separada por usuário.
+    """
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        key = request.headers.get('Idempotency-Key')
+        if not key:
+            return fn(*args, **kwargs)
+        if len(key) > 255:
+            return jsonify({"msg": "Idempotency-Key muito longa (máximo de 255 caracteres)"}), 400
+
+        record_id = f"{get_jwt_identity()}:{request.method}:{request.path}:{key}"
+        fingerprint = _request_fingerprint()
+
+        now = datetime.utcnow()
+        lease_until = now + timedelta(seconds=IdempotencyKey.lease_seconds())
+        while True:
+            try:
+                IdempotencyKey.collection().insert_one({
+                    "_id": record_id,
+                    "fingerprint": fingerprint,
+                    "state": "em_andamento",
+                    "created_at": now,
+                    "lease_until": lease_until
+                })
+                record = None
+                break
+            except DuplicateKeyError:
+                record = IdempotencyKey.collection().find_one({"_id": record_id})
+                if record is not None:
+                    break
+                # A tentativa anterior falhou e removeu o registro entre o insert e a leitura: tenta de novo
+
+        if record is not None:
+            if record.get("fingerprint") != fingerprint:
+                return jsonify({"msg": "Idempotency-Key já usada com outra requisição"}), 422
+            if record.get("state") != "concluido":
+                # Prazo vencido: a execução anterior foi abandonada e esta tentativa a assume
+                taken_over = IdempotencyKey.collection().update_one(
+                    {"_id": record_id, "state": "em_andamento", "lease_until": {"$not": {"$gte": now}}},
+                    {"$set": {"lease_until": lease_until}}
+                ).modified_count
+                if not taken_over:
+                    return jsonify({"msg": "Requisição com esta Idempotency-Key ainda em processamento"}), 409, {"Retry-After": "1"}
+                record = None
+        if record:
+            response = make_response(record["body"], record["status_code"])
+            response.mimetype = record.get("mimetype") or 'application/json'
+            response.headers["Idempotent-Replayed"] = "true"
+            return response
+
+        try:
+            response = make_response(fn(*args, **kwargs))
+        except Exception:
+            IdempotencyKey.collection().delete_one({"_id": record_id})
+            raise
+
+        if response.status_code >= 500 or response.is_streamed:
+            # Erros do servidor não são gravados: a próxima tentativa executa a rota de novo
+            IdempotencyKey.collection().delete_one({"_id": record_id})
+        else:
+            IdempotencyKey.collection().update_one({"_id": record_id}, {"$set": {
+                "state": "concluido",
+                "status_code": response.status_code,
+                "mimetype": response.mimetype,
+                "body": response.get_data(as_text=True)
+            }})
+        return response
+    return wrapper
@@ -0,0 +1,2 @@
+# conftest.py
+# Na raiz do projeto para que o pytest coloque a raiz no sys.path (importação do pacote app nos testes).
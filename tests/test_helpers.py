@@ -0,0 +1,147 @@
+# tests/test_helpers.py
+"""
+Funções puras usadas nas escritas e exportações de produtos:
+
+    python -m pytest tests/test_helpers.py    (a partir da raiz do projeto)
+
+product_stats_delta (app/stats.py), hazard_mask (app/compatibility.py),
+normalize_quantity (app/capacity.py) e stream_zip (app/streaming.py).
+Nenhum teste acessa o MongoDB.
+"""
+import io
+import zipfile
+from datetime import datetime
+
+import pytest
+
+from app.capacity import normalize_quantity
+from app.compatibility import hazard_mask, mask_classes
+from app.stats import product_stats_delta
+from app.streaming import stream_zip
+
+
+# ------------------------------------------------------------
+# product_stats_delta
+# ------------------------------------------------------------
+
+PRODUCT = {'status': 'pendente', 'empresa': 'ACME', 'categoria': 'solvente', 'palavra_de_perigo': 'Perigo'}
+
+
+def test_stats_delta_on_create():
+    assert product_stats_delta(None, PRODUCT) == {
+        'total': 1,
+        'status.pendente': 1,
+        'empresa.ACME': 1,
+        'categoria.solvente': 1,
+        'palavra_de_perigo.Perigo': 1,
+    }
+
+
+def test_stats_delta_on_delete():
+    delta = product_stats_delta(PRODUCT, None)
+    assert delta['total'] == -1
+    assert delta['status.pendente'] == -1
+
+
+def test_stats_delta_on_update_keeps_only_changed_counters():
+    updated = dict(PRODUCT, status='aprovado')
+    assert product_stats_delta(PRODUCT, updated) == {'status.pendente': -1, 'status.aprovado': 1}
+
+
+def test_stats_delta_soft_delete_counts_as_removal():
+    deleted = dict(PRODUCT, deleted_at=datetime(2025, 1, 1))
+    assert product_stats_delta(PRODUCT, deleted)['total'] == -1
+    assert product_stats_delta(deleted, deleted) == {}
+
+
+def test_stats_delta_escapes_keys_and_empty_values():
+    delta = product_stats_delta(None, dict(PRODUCT, empresa='A.B Ltda', categoria='', status='$x'))
+    assert 'empresa.A．B Ltda' in delta
+    assert 'categoria.nao_informado' in delta
+    assert 'status.＄x' in delta
+
+
+# ------------------------------------------------------------
+# hazard_mask
+# ------------------------------------------------------------
+
+@pytest.mark.parametrize('doc, expected', [
+    ({}, []),
+    ({'perigos_fisicos': ['H225 Líquido e vapores altamente inflamáveis']}, ['inflamavel']),
+    ({'perigos_fisicos': ['GHS03']}, ['oxidante']),
+    ({'perigos_saude': ['H314 Provoca queimadura severa']}, ['corrosivo']),
+    ({'perigos_saude': ['Tóxico se ingerido']}, ['toxico']),
+    ({'perigos_saude': ['Toxicidade para órgãos-alvo específicos']}, ['perigo_a_saude']),
+    ({'perigos_meio_ambiente': ['Tóxico para organismos aquáticos']}, ['meio_ambiente']),
+    ({'perigos_fisicos': ['Não inflamável']}, []),
+    ({'perigos_fisicos': ['Inflamável'], 'perigos_saude': ['Corrosivo']}, ['inflamavel', 'corrosivo']),
+])
+def test_hazard_mask(doc, expected):
+    assert mask_classes(hazard_mask(doc)) == expected
+
+
+def test_hazard_codes_take_precedence_over_text():
+    # O código H302 (nocivo, GHS07) prevalece sobre a palavra 'tóxico' no mesmo perigo
+    assert mask_classes(hazard_mask({'perigos_saude': ['H302 Tóxico se ingerido']})) == ['irritante']
+
+
+# ------------------------------------------------------------
+# normalize_quantity
+# ------------------------------------------------------------
+
+@pytest.mark.parametrize('value, expected', [
+    ('200 L', {'valor': 200.0, 'unidade': 'L'}),
+    ('500 mL', {'valor': 0.5, 'unidade': 'L'}),
+    ('1.500,5 kg', {'valor': 1500.5, 'unidade': 'kg'}),
+    ('1,500.5 kg', {'valor': 1500.5, 'unidade': 'kg'}),
+    ('1.500 kg', {'valor': 1500.0, 'unidade': 'kg'}),
+    ('2,5kg', {'valor': 2.5, 'unidade': 'kg'}),
+    ('250 g', {'valor': 0.25, 'unidade': 'kg'}),
+    ('1 m³', {'valor': 1000.0, 'unidade': 'L'}),
+    ('3 Litros', {'valor': 3.0, 'unidade': 'L'}),
+])
+def test_normalize_quantity(value, expected):
+    assert normalize_quantity(value) == expected
+
+
+@pytest.mark.parametrize('value', [None, 200, '', 'muito', '200', '200 caixas', 'kg 200'])
+def test_normalize_quantity_unrecognized(value):
+    assert normalize_quantity(value) is None
+
+
+# ------------------------------------------------------------
+# stream_zip
+# ------------------------------------------------------------
+
+def test_stream_zip_roundtrip():
+    big = bytes(range(256)) * 1000
+    entries = [
+        ('a.txt', [b'ola ', b'mundo'], True),
+        ('dados/b.bin', (big[i:i + 4096] for i in range(0, len(big), 4096)), False),
+        ('vazio.txt', [], True),
+    ]
+    data = b''.join(stream_zip(entries))
+
+    with zipfile.ZipFile(io.BytesIO(data)) as archive:
+        assert archive.testzip() is None
+        assert archive.namelist() == ['a.txt', 'dados/b.bin', 'vazio.txt']
+        assert archive.read('a.txt') == b'ola mundo'
+        assert archive.read('dados/b.bin') == big
+        assert archive.read('vazio.txt') == b''
+        assert archive.getinfo('a.txt').compress_type == zipfile.ZIP_DEFLATED
+        assert archive.getinfo('dados/b.bin').compress_type == zipfile.ZIP_STORED
+
+
+def test_stream_zip_yields_while_entries_are_written():
+    produced = []
+
+    def chunks():
+        for i in range(3):
+            produced.append(i)
+            yield b'x' * 100000
+
+    stream = stream_zip([('grande.bin', chunks(), False)])
+    next(stream)
+    # O primeiro bloco sai antes de todos os dados da entrada serem lidos
+    assert len(produced) < 3
+    list(stream)
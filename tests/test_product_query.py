@@ -0,0 +1,90 @@
+# tests/test_product_query.py
+"""
+Combinações de filtros e ordenação de GET /products (app/product_query.py):
+
+    python -m pytest tests/test_product_query.py    (a partir da raiz do projeto)
+
+Cada combinação aceita precisa de um índice de Product.QUERY_INDEXES; as demais
+devem ser recusadas com mensagem para resposta 400.
+"""
+import pytest
+
+from app.product_query import build_product_query, find_supporting_index
+
+
+@pytest.mark.parametrize('args, expected_query, expected_sort', [
+    ({}, {}, [('_id', -1)]),
+    ({'status': 'aprovado'}, {'status': 'aprovado'}, [('_id', -1)]),
+    ({'status': 'aprovado', 'sort': '-updated_at'}, {'status': 'aprovado'}, [('updated_at', -1)]),
+    ({'created_by': 'u1'}, {'created_by_user_id': 'u1'}, [('_id', -1)]),
+    ({'status': 'aprovado', 'empresa': 'ACME'}, {'status': 'aprovado', 'empresa': 'ACME'}, [('_id', -1)]),
+    ({'local_de_armazenamento': 'A', 'empresa': 'ACME'},
+     {'empresa': 'ACME', 'local_de_armazenamento': 'A'}, [('_id', -1)]),
+    ({'sort': 'nome_do_produto'}, {}, [('nome_do_produto', 1)]),
+    ({'sort': '-codigo'}, {}, [('codigo', -1)]),
+    ({'status': '  '}, {}, [('_id', -1)]),
+])
+def test_accepted_combinations(args, expected_query, expected_sort):
+    query, sort, error = build_product_query(args)
+    assert error is None
+    assert query == expected_query
+    assert sort == expected_sort
+
+
+def test_date_range_sorts_by_the_range_field():
+    query, sort, error = build_product_query({'created_at_de': '2025-01-01T00:00:00Z'})
+    assert error is None
+    assert sort == [('created_at', -1)]
+    assert set(query['created_at']) == {'$gte'}
+
+
+def test_date_range_with_filter_on_updated_at():
+    query, sort, error = build_product_query({
+        'status': 'aprovado',
+        'updated_at_de': '2025-01-01',
+        'updated_at_ate': '2025-02-01',
+        'sort': 'updated_at',
+    })
+    assert error is None
+    assert sort == [('updated_at', 1)]
+    assert query['status'] == 'aprovado'
+    assert set(query['updated_at']) == {'$gte', '$lte'}
+
+
+@pytest.mark.parametrize('args', [
+    {'status': 'aprovado', 'sort': 'nome_do_produto'},
+    {'status': 'aprovado', 'categoria': 'solvente'},
+    {'status': 'aprovado', 'empresa': 'ACME', 'categoria': 'solvente'},
+    {'status': 'aprovado', 'created_at_de': '2025-01-01'},
+    {'created_at_de': '2025-01-01', 'sort': '-_id'},
+    {'empresa': 'ACME', 'sort': 'created_at'},
+])
+def test_combinations_without_index_are_rejected(args):
+    query, sort, error = build_product_query(args)
+    assert query is None and sort is None
+    assert 'sem índice correspondente' in error
+
+
+def test_invalid_sort_field_is_rejected():
+    _, _, error = build_product_query({'sort': 'fornecedor'})
+    assert error.startswith('Ordenação inválida')
+
+
+def test_invalid_date_is_rejected():
+    _, _, error = build_product_query({'created_at_de': 'ontem'})
+    assert "created_at_de" in error
+
+
+def test_ranges_on_two_fields_are_rejected():
+    _, _, error = build_product_query({'created_at_de': '2025-01-01', 'updated_at_ate': '2025-02-01'})
+    assert 'apenas um campo' in error
+
+
+def test_supporting_index_ignores_equality_order():
+    keys = find_supporting_index(['empresa', 'status'], None, '_id')
+    assert [name for name, _ in keys] == ['status', 'empresa', '_id']
+
+
+def test_range_must_be_the_sort_field():
+    assert find_supporting_index([], 'created_at', 'created_at') is not None
+    assert find_supporting_index([], 'created_at', 'updated_at') is None
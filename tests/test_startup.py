@@ -0,0 +1,47 @@
+# tests/test_startup.py
+"""
+Orçamento de inicialização (app/startup_benchmark.py) aplicado como teste:
+
+    python -m pytest tests/test_startup.py    (a partir da raiz do projeto)
+
+Os limites são os mesmos do script (STARTUP_IMPORT_BUDGET_MS e
+STARTUP_FIRST_REQUEST_BUDGET_MS). Cada medição roda em um processo Python novo.
+"""
+import pytest
+
+from app.startup_benchmark import (
+    FIRST_REQUEST_BUDGET_MS,
+    IMPORT_BUDGET_MS,
+    measure_first_request,
+    measure_imports,
+)
+
+
+@pytest.fixture(scope='module')
+def first_request():
+    return measure_first_request()
+
+
+def test_import_budget():
+    import_ms, slowest = measure_imports()
+    assert import_ms <= IMPORT_BUDGET_MS, (
+        f"Importações até create_app() levaram {import_ms:.0f} ms (orçamento {IMPORT_BUDGET_MS} ms). "
+        f"Mais lentas: {slowest[:5]}"
+    )
+
+
+def test_first_request_budget(first_request):
+    elapsed_ms, _, _ = first_request
+    assert elapsed_ms <= FIRST_REQUEST_BUDGET_MS, (
+        f"Primeira resposta levou {elapsed_ms:.0f} ms (orçamento {FIRST_REQUEST_BUDGET_MS} ms)"
+    )
+
+
+def test_heavy_modules_are_lazy(first_request):
+    _, lazy_loaded, _ = first_request
+    assert not lazy_loaded, f"Módulos carregados na inicialização: {', '.join(lazy_loaded)}"
+
+
+def test_mongo_not_accessed_at_startup(first_request):
+    _, _, db_connected = first_request
+    assert not db_connected, "O MongoDB foi acessado durante a inicialização"